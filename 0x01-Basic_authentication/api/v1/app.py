@@ -3,10 +3,13 @@
 Route module for the API
 """
 from os import getenv
+from api.v1.metrics import METRICS
 from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from flask import Flask, jsonify, abort, request, g
 from flask_cors import (CORS, cross_origin)
+from models.base import DATA, WRITE_STATS
 import os
+import time
 
 
 app = Flask(__name__)
@@ -34,6 +37,40 @@ def define_auth():
 auth = define_auth()
 
 
+def collect_storage():
+    """
+    It yields, at scrape time, the model file writes and the sizes of the
+    models
+    :return: An iterable of (name, labels, value)
+    """
+    for s_class, (count, seconds, size) in list(WRITE_STATS.items()):
+        labels = (('model', s_class),)
+        yield ('model_file_writes_total', labels, count)
+        yield ('model_file_write_seconds_total', labels, seconds)
+        yield ('model_file_write_bytes_total', labels, size)
+    for s_class, objs in list(DATA.items()):
+        yield ('model_objects', (('model', s_class),), len(objs))
+
+
+METRICS.describe('model_file_writes_total', 'counter',
+                 'Base.save_to_file calls by model')
+METRICS.describe('model_file_write_seconds_total', 'counter',
+                 'Time spent in Base.save_to_file by model')
+METRICS.describe('model_file_write_bytes_total', 'counter',
+                 'Bytes written by Base.save_to_file by model')
+METRICS.describe('model_objects', 'gauge', 'Objects loaded by model')
+METRICS.add_collector(collect_storage)
+
+
+@app.before_request
+def start_timer():
+    """
+    It records the start time of the request, it runs before the
+    authentication so rejected requests are timed too
+    """
+    g.request_start = time.perf_counter()
+
+
 @app.before_request
 def before_request():
     """
@@ -45,16 +82,39 @@ def before_request():
     """
     if auth is None:
         return
-    paths = ['/api/v1/status/', '/api/v1/unauthorized/', '/api/v1/forbidden/']
+    paths = ['/api/v1/status/', '/api/v1/unauthorized/', '/api/v1/forbidden/',
+             '/api/v1/metrics/']
 
     if not auth.require_auth(request.path, paths):
         return
     if auth.authorization_header(request) is None:
+        METRICS.inc('auth_rejections_total', (('status', 401),))
         return abort(401)
-    if auth.current_user(request) is None:
+    start = time.perf_counter()
+    current_user = auth.current_user(request)
+    METRICS.observe('auth_current_user_seconds', (),
+                    time.perf_counter() - start)
+    if current_user is None:
+        METRICS.inc('auth_rejections_total', (('status', 403),))
         return abort(403)
 
 
+@app.after_request
+def record_request(response):
+    """
+    It records the latency of the request by route, method and status
+    :return: the response object.
+    """
+    start = g.get('request_start')
+    if start is not None:
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        METRICS.observe('http_request_duration_seconds',
+                        (('route', rule), ('method', request.method),
+                         ('status', response.status_code)),
+                        time.perf_counter() - start)
+    return response
+
+
 @app.errorhandler(404)
 def not_found(error) -> str:
     """ Not found handler
@@ -14,6 +14,17 @@ def status() -> str:
     return jsonify({"status": "OK"})
 
 
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Return:
+      - the metrics of the API in the Prometheus text format
+    """
+    from api.v1.metrics import METRICS
+    return METRICS.render(), 200, \
+        {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @app_views.route('/stats/', strict_slashes=False)
 def stats() -> str:
     """ GET /api/v1/stats
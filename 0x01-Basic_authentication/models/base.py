@@ -5,11 +5,13 @@ from datetime import datetime
 from typing import TypeVar, List, Iterable
 from os import path
 import json
+import time
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+WRITE_STATS = {}
 
 
 class Base():
@@ -82,8 +84,14 @@ class Base():
         for obj_id, obj in DATA[s_class].items():
             objs_json[obj_id] = obj.to_json(True)
 
+        start = time.perf_counter()
+        content = json.dumps(objs_json)
         with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+            f.write(content)
+        stats = WRITE_STATS.setdefault(s_class, [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+        stats[2] += len(content)
 
     def save(self):
         """ Save current object
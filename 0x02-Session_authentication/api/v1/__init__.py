@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+""" API v1 package, `STARTUP_PROFILE` times the imports of the API
+"""
+from os import getenv
+
+if getenv("STARTUP_PROFILE"):
+    from api.v1.startup import profile_imports
+    profile_imports()
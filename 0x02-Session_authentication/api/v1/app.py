@@ -2,45 +2,101 @@
 """
 Route module for the API
 """
+from importlib import import_module
 from os import getenv
+from api.v1 import startup
+from api.v1.metrics import METRICS
 from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from flask import Flask, jsonify, abort, request, g
 from flask_cors import (CORS, cross_origin)
+from models.base import DATA, WRITE_STATS
 import os
+import time
 
 
+SESSION_DB_COUNT_MAX_AGE = 60
+
 app = Flask(__name__)
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
 
+AUTH_TYPES = {
+    'auth': ('api.v1.auth.auth', 'Auth'),
+    'basic_auth': ('api.v1.auth.basic_auth', 'BasicAuth'),
+    'session_auth': ('api.v1.auth.session_auth', 'SessionAuth'),
+    'session_exp_auth': ('api.v1.auth.session_exp_auth', 'SessionExpAuth'),
+    'session_db_auth': ('api.v1.auth.session_db_auth', 'SessionDBAuth'),
+    'session_sqlite_auth': ('api.v1.auth.session_sqlite_auth',
+                            'SessionSQLiteAuth'),
+    'signed_session_auth': ('api.v1.auth.signed_session_auth',
+                            'SignedSessionAuth'),
+}
+
+
 def define_auth():
     """
     It returns an instance of the class that is specified in the environment
-    variable `AUTH_TYPE`
+    variable `AUTH_TYPE`, only the module of that class is imported
     :return: The class that is being returned is the one that is being selected
     """
-    auth = None
     selected_class = os.getenv('AUTH_TYPE')
-    if selected_class == 'auth':
-        from api.v1.auth.auth import Auth
-        auth = Auth()
-    if selected_class == 'basic_auth':
-        from api.v1.auth.basic_auth import BasicAuth
-        auth = BasicAuth()
-    if selected_class == 'session_auth':
-        from api.v1.auth.session_auth import SessionAuth
-        auth = SessionAuth()
-    if selected_class == 'session_exp_auth':
-        from api.v1.auth.session_exp_auth import SessionExpAuth
-        auth = SessionExpAuth()
-    if selected_class == 'session_db_auth':
-        from api.v1.auth.session_db_auth import SessionDBAuth
-        auth = SessionDBAuth()
+    if selected_class not in AUTH_TYPES:
+        return None
+    module_name, class_name = AUTH_TYPES[selected_class]
+    start = time.perf_counter()
+    auth = getattr(import_module(module_name), class_name)()
+    startup.TIMINGS['auth'][class_name] = time.perf_counter() - start
     return auth
 
 
 auth = define_auth()
+if getenv("STARTUP_WARMUP") == "background":
+    startup.start_warm_up()
+
+
+def collect_storage():
+    """
+    It yields, at scrape time, the model file writes and the sizes of the
+    models and of the session store
+    :return: An iterable of (name, labels, value)
+    """
+    for s_class, (count, seconds, size) in list(WRITE_STATS.items()):
+        labels = (('model', s_class),)
+        yield ('model_file_writes_total', labels, count)
+        yield ('model_file_write_seconds_total', labels, seconds)
+        yield ('model_file_write_bytes_total', labels, size)
+    for s_class, objs in list(DATA.items()):
+        yield ('model_objects', (('model', s_class),), len(objs))
+    store = getattr(auth, 'user_id_by_session_id', None)
+    if store is not None:
+        yield ('session_store_size', (), len(store))
+    if getattr(auth, 'session_db', None) is not None:
+        yield ('session_db_size', (),
+               auth.session_db.count(SESSION_DB_COUNT_MAX_AGE))
+
+
+METRICS.describe('model_file_writes_total', 'counter',
+                 'Base.save_to_file calls by model')
+METRICS.describe('model_file_write_seconds_total', 'counter',
+                 'Time spent in Base.save_to_file by model')
+METRICS.describe('model_file_write_bytes_total', 'counter',
+                 'Bytes written by Base.save_to_file by model')
+METRICS.describe('model_objects', 'gauge', 'Objects loaded by model')
+METRICS.describe('session_store_size', 'gauge',
+                 'Sessions in the session store')
+METRICS.describe('session_db_size', 'gauge',
+                 'Sessions in the session DB, counted at most once a minute')
+METRICS.add_collector(collect_storage)
+
+
+@app.before_request
+def start_timer():
+    """
+    It records the start time of the request, it runs before the
+    authentication so rejected requests are timed too
+    """
+    g.request_start = time.perf_counter()
 
 
 @app.before_request
@@ -52,20 +108,46 @@ def before_request():
     then abort the request with a 401 or 403 status code
     :return: the response object.
     """
+    if request.path.rstrip('/') == '/api/v1/ready':
+        return
+    startup.ensure_loaded()
     if auth is None:
         return
     paths = ['/api/v1/status/', '/api/v1/unauthorized/',
-             '/api/v1/forbidden/', '/api/v1/auth_session/login/']
+             '/api/v1/forbidden/', '/api/v1/auth_session/login/',
+             '/api/v1/metrics/']
 
     if not auth.require_auth(request.path, paths):
         return
 
     if auth.authorization_header(request) is None\
             and auth.session_cookie(request) is None:
+        METRICS.inc('auth_rejections_total', (('status', 401),))
         abort(401)
-    if auth.current_user(request) is None:
+    start = time.perf_counter()
+    current_user = auth.current_user(request)
+    METRICS.observe('auth_current_user_seconds', (),
+                    time.perf_counter() - start)
+    if current_user is None:
+        METRICS.inc('auth_rejections_total', (('status', 403),))
         abort(403)
-    request.current_user = auth.current_user(request)
+    request.current_user = current_user
+
+
+@app.after_request
+def record_request(response):
+    """
+    It records the latency of the request by route, method and status
+    :return: the response object.
+    """
+    start = g.get('request_start')
+    if start is not None:
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        METRICS.observe('http_request_duration_seconds',
+                        (('route', rule), ('method', request.method),
+                         ('status', response.status_code)),
+                        time.perf_counter() - start)
+    return response
 
 
 @app.errorhandler(404)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+""" ASGI entry point
+
+Serves the Flask app of `api.v1.app` under an ASGI server:
+
+    $ API_HOST=0.0.0.0 API_PORT=5000 \\
+        uvicorn api.v1.asgi:application --host 0.0.0.0 --port 5000
+
+Each request runs the unchanged WSGI app, so the routes of `app_views` and
+the `before_request` checks are the same, on one of `ASGI_WORKERS` threads.
+Auth and storage calls block, the event loop only reads requests and
+writes responses. At most `ASGI_MAX_PENDING` requests wait for a thread,
+the next ones get a 503 at once instead of queueing.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import os
+import sys
+from api.v1.app import app
+from api.v1.metrics import METRICS
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """
+    It builds the WSGI environ of an ASGI HTTP request, repeated headers
+    are joined with ',' except `cookie` ones, joined with '; ' as HTTP/2
+    clients send one per cookie (RFC 9113, section 8.2.3)
+
+    :param scope: The ASGI connection scope
+    :param body: The request body
+    :return: The environ dictionary
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = 'HTTP_' + name
+        if key in environ:
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            value = environ[key] + separator + value
+        environ[key] = value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ: dict) -> tuple:
+    """
+    It runs a WSGI app to completion
+
+    :param wsgi_app: The WSGI callable
+    :param environ: The WSGI environ
+    :return: The (status code, headers, body) of the response
+    """
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        """ Record the status line and the headers """
+        started[:] = [int(status.split(' ', 1)[0]), headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return (started[0], started[1], body)
+
+
+class ASGIAdapter():
+    """ ASGI application running a WSGI app in a bounded thread pool """
+
+    def __init__(self, wsgi_app, workers: int, max_pending: int):
+        """
+        It creates the pool of threads
+
+        :param wsgi_app: The WSGI callable
+        :param workers: The number of threads running requests
+        :param max_pending: The number of requests waiting for a thread
+        before new ones are rejected
+        """
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self.capacity = workers + max_pending
+        self.in_flight = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='asgi')
+
+    @classmethod
+    def from_env(cls, wsgi_app) -> 'ASGIAdapter':
+        """
+        It creates an adapter sized from `ASGI_WORKERS` (the number of CPUs
+        plus 4, at most 32, by default) and `ASGI_MAX_PENDING` (64)
+
+        :param wsgi_app: The WSGI callable
+        :return: The adapter
+        """
+        try:
+            workers = int(os.getenv("ASGI_WORKERS", 0))
+        except ValueError:
+            workers = 0
+        try:
+            max_pending = int(os.getenv("ASGI_MAX_PENDING", 64))
+        except ValueError:
+            max_pending = 64
+        if workers <= 0:
+            workers = min(32, (os.cpu_count() or 1) + 4)
+        return cls(wsgi_app, workers, max(0, max_pending))
+
+    async def __call__(self, scope, receive, send):
+        """ Serve one ASGI connection """
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if self.in_flight >= self.capacity:
+            METRICS.inc('asgi_rejections_total')
+            await self.respond(send, 503, [
+                (b'content-type', b'application/json'),
+                (b'retry-after', b'1')], b'{"error":"Service Unavailable"}\n')
+            return
+        self.in_flight += 1
+        try:
+            body = []
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.append(message.get('body', b''))
+                more_body = message.get('more_body', False)
+            environ = build_environ(scope, b''.join(body))
+            status, headers, content = \
+                await asyncio.get_running_loop().run_in_executor(
+                    self.executor, run_wsgi, self.wsgi_app, environ)
+        finally:
+            self.in_flight -= 1
+        await self.respond(send, status, [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers], content)
+
+    @staticmethod
+    async def respond(send, status: int, headers: list, body: bytes):
+        """ Send a complete response """
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        """ Acknowledge the startup and shut the pool down on shutdown """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def collect(self):
+        """ Yield the size and the load of the pool at scrape time """
+        yield ('asgi_workers', (), self.workers)
+        yield ('asgi_requests_in_flight', (), self.in_flight)
+
+
+application = ASGIAdapter.from_env(app)
+METRICS.describe('asgi_workers', 'gauge',
+                 'Threads running requests under ASGI')
+METRICS.describe('asgi_requests_in_flight', 'gauge',
+                 'Requests running or waiting for a thread under ASGI')
+METRICS.describe('asgi_rejections_total', 'counter',
+                 'Requests rejected with 503 because the ASGI pool was full')
+METRICS.add_collector(application.collect, 'asgi')
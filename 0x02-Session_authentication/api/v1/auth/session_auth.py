@@ -3,12 +3,14 @@
 
 import uuid
 from api.v1.auth.auth import Auth
+from api.v1.auth.session_store import Counters, open_session_store
 from models.user import User
 
 
 class SessionAuth(Auth):
     """ Session Auth class"""
-    user_id_by_session_id = {}
+    user_id_by_session_id = open_session_store()
+    session_counters = Counters('created', 'destroyed', 'expired')
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -23,6 +25,7 @@ class SessionAuth(Auth):
             return None
         session_id = str(uuid.uuid4())
         self.user_id_by_session_id[session_id] = user_id
+        self.session_counters.inc('created')
         return session_id
 
     def user_id_for_session_id(self, session_id: str = None) -> str:
@@ -38,6 +41,17 @@ class SessionAuth(Auth):
             return None
         return self.user_id_by_session_id.get(session_id)
 
+    def session_stats(self) -> dict:
+        """
+        It returns the session counters and the number of active sessions,
+        every value is maintained incrementally
+
+        :return: A dictionary of counters
+        """
+        stats = self.session_counters.snapshot()
+        stats['active'] = len(self.user_id_by_session_id)
+        return stats
+
     def current_user(self, request=None):
         """
         Return the user ID for the given session ID.
@@ -65,8 +79,6 @@ class SessionAuth(Auth):
         user_id = self.user_id_for_session_id(session_id)
         if not user_id:
             return False
-        try:
-            del self.user_id_by_session_id[session_id]
-        except Exception:
-            pass
+        self.user_id_by_session_id.pop(session_id)
+        self.session_counters.inc('destroyed')
         return True
@@ -2,7 +2,10 @@
 """ Session db Auth module"""
 
 from datetime import datetime, timedelta
+import os
+import time
 from api.v1.auth.session_exp_auth import SessionExpAuth
+from models.base import STORAGE_LOCK
 from models.user_session import UserSession
 
 
@@ -10,6 +13,32 @@ class SessionDBAuth(SessionExpAuth):
     """ It's a session manager that uses the
     database to store session information"""
 
+    def __init__(self):
+        """
+        It initializes the session duration and, when sessions expire,
+        starts the thread deleting the expired stored sessions every
+        `SESSION_PURGE_INTERVAL` seconds (60 by default). In sliding mode
+        it also starts the thread writing pending `last_seen` refreshes
+        every `SESSION_TOUCH_FLUSH_INTERVAL` seconds (5 by default)
+        """
+        super().__init__()
+        if self.session_duration <= 0:
+            return
+        try:
+            interval = float(os.getenv("SESSION_PURGE_INTERVAL", 60))
+        except ValueError:
+            interval = 60
+        if interval > 0:
+            self.run_every(interval, self.purge_expired, 'session-purge')
+        if not self.sliding:
+            return
+        try:
+            interval = float(os.getenv("SESSION_TOUCH_FLUSH_INTERVAL", 5))
+        except ValueError:
+            interval = 5
+        if interval > 0:
+            self.run_every(interval, self.flush_touches, 'session-touches')
+
     def create_session(self, user_id=None):
         """
         It creates a session for a user.
@@ -24,8 +53,7 @@ class SessionDBAuth(SessionExpAuth):
         if not session_id:
             return None
         new_session = UserSession(user_id=user_id, session_id=session_id)
-        new_session.save()
-        UserSession.save_to_file()
+        self.save_user_session(new_session)
         return session_id
 
     def user_id_for_session_id(self, session_id=None):
@@ -38,17 +66,157 @@ class SessionDBAuth(SessionExpAuth):
 
         if session_id is None:
             return None
-        UserSession.load_from_file()
-        matches = UserSession.search({'session_id': session_id})
-        if not matches:
+        user_session = self.find_user_session(session_id)
+        if user_session is None:
             return None
-        user_session = matches[0]
+        if self.sliding:
+            return self.touch_user_session(user_session)
         created_at = user_session.created_at
         if created_at + timedelta(seconds=self.session_duration) <\
-                datetime.now():
+                datetime.utcnow():
+            return None
+        return user_session.user_id
+
+    def touch_user_session(self, user_session):
+        """
+        It checks the idle timeout of a stored session and queues a refresh
+        of its `last_seen` time when it is older than `touch_interval`
+
+        :param user_session: The UserSession looked up
+        :return: The user_id of the session, or None if it is expired
+        """
+        session_id = user_session.session_id
+        last_seen = self.session_touches.get(session_id) or\
+            user_session.last_seen or user_session.created_at
+        now = datetime.utcnow()
+        idle = (now - last_seen).total_seconds()
+        if idle > self.session_duration:
             return None
+        if idle < self.touch_interval:
+            self.session_touches.skip()
+        else:
+            self.session_touches.touch(session_id, now)
         return user_session.user_id
 
+    def reap(self, now: float = None, limit: int = 0) -> int:
+        """
+        It drops the expired sessions of the in-memory mirror filled by
+        SessionExpAuth, they aren't counted as expired: the stored
+        sessions are, when `purge_expired` deletes them
+
+        :param now: The current `time.time()` value
+        :type now: float
+        :param limit: The maximum number of sessions dropped (0 means all)
+        :type limit: int
+        :return: The number of sessions dropped
+        """
+        if now is None:
+            now = time.time()
+        expired = self.session_expiry.pop_expired(now, limit)
+        for session_id in expired:
+            self.user_id_by_session_id.pop_if(
+                session_id,
+                lambda value: not isinstance(value, dict) or
+                value.get('expires_at', 0) <= now)
+        return len(expired)
+
+    def purge_expired(self) -> int:
+        """
+        It deletes the stored sessions idle or created for longer than the
+        session duration with one rewrite of the session file
+
+        :return: The number of sessions deleted
+        """
+        if self.session_duration <= 0:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(seconds=self.session_duration)
+        with STORAGE_LOCK:
+            UserSession.reload_if_changed()
+            expired = []
+            for user_session in UserSession.all():
+                started = user_session.created_at
+                if self.sliding:
+                    started = self.session_touches.get(
+                        user_session.session_id) or \
+                        user_session.last_seen or started
+                if started < cutoff:
+                    expired.append(user_session)
+            purged = UserSession.remove_many(expired)
+        if purged:
+            self.session_counters.inc('expired', purged)
+        return purged
+
+    def flush_touches(self) -> int:
+        """
+        It writes every pending `last_seen` refresh in a single batch
+
+        :return: The number of sessions updated
+        """
+        pending = self.session_touches.drain()
+        if not pending:
+            return 0
+        return self.save_touches(pending)
+
+    def find_user_session(self, session_id: str) -> UserSession:
+        """
+        It returns the stored session with the given session ID, reloading
+        the session file only if it was changed by another process
+
+        :param session_id: The session ID
+        :return: The UserSession, or None if it doesn't exist
+        """
+        UserSession.reload_if_changed()
+        return UserSession.get_by_session_id(session_id)
+
+    def save_user_session(self, user_session: UserSession) -> None:
+        """
+        It stores a new session, `save` rewrites the session file once
+
+        :param user_session: The UserSession to store
+        """
+        user_session.save()
+
+    def remove_user_session(self, user_session: UserSession) -> None:
+        """
+        It deletes a stored session, `remove` rewrites the session file once
+
+        :param user_session: The UserSession to delete
+        """
+        user_session.remove()
+
+    def save_touches(self, pending: dict) -> int:
+        """
+        It writes `last_seen` refreshes with a single rewrite of the
+        session file, holding the storage lock so request threads don't
+        add or remove sessions while the file is written
+
+        :param pending: A dictionary of session ID to `last_seen`
+        :return: The number of sessions updated
+        """
+        updated = 0
+        with STORAGE_LOCK:
+            UserSession.reload_if_changed()
+            for session_id, last_seen in pending.items():
+                user_session = UserSession.get_by_session_id(session_id)
+                if user_session is not None:
+                    user_session.last_seen = last_seen
+                    updated += 1
+            if updated:
+                UserSession.save_to_file()
+        return updated
+
+    def session_stats(self) -> dict:
+        """
+        It returns the session counters and the number of stored sessions,
+        the expired ones are deleted every `SESSION_PURGE_INTERVAL` seconds
+
+        :return: A dictionary of counters
+        """
+        stats = self.session_counters.snapshot()
+        UserSession.reload_if_changed()
+        stats['active'] = UserSession.count()
+        return stats
+
     def destroy_session(self, request=None):
         """
         It deletes the session id from the dictionary
@@ -65,14 +233,12 @@ class SessionDBAuth(SessionExpAuth):
         user_id = self.user_id_for_session_id(session_cookie)
         if user_id is None:
             return False
-        user_session = UserSession.search({
-            'session_id': session_cookie
-        })
+        user_session = self.find_user_session(session_cookie)
         if user_session is None:
             return False
         try:
-            user_session[0].remove()
-            UserSession.save_to_file()
+            self.remove_user_session(user_session)
+            self.session_counters.inc('destroyed')
             return True
         except Exception as e:
             return False
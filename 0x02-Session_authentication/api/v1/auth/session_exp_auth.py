@@ -2,24 +2,52 @@
 """
 Module of expiration Class
 """
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
+import sys
+import threading
+import time
 from api.v1.auth.session_auth import SessionAuth
+from api.v1.auth.session_store import ExpiryIndex, TouchBuffer
 
 
 class SessionExpAuth(SessionAuth):
-    """ Session Exp Auth class"""
+    """ Session Exp Auth class, the `last_seen` and `expires_at` times of
+    a session are wall-clock epoch seconds, so they mean the same to every
+    process sharing the session store"""
+    session_expiry = ExpiryIndex()
+    session_touches = TouchBuffer()
+    reap_batch_size = 64
+    _reaper = None
 
     def __init__(self):
         """
         It initializes the class by setting the session duration to
         the value of the environment variable
-        `SESSION_DURATION` if it exists, or to 0 if it doesn't
+        `SESSION_DURATION` if it exists, or to 0 if it doesn't.
+        When `SESSION_SLIDING` is set, sessions expire after being idle for
+        that duration, and their `last_seen` time is only refreshed once it
+        is older than `SESSION_TOUCH_FRACTION` of the duration.
+        A background reaper is started when `SESSION_REAPER_INTERVAL`
+        is a positive number of seconds
         """
         try:
             self.session_duration = int(os.getenv("SESSION_DURATION", 0))
         except ValueError:
             self.session_duration = 0
+        self.sliding = os.getenv("SESSION_SLIDING", "").lower() in \
+            ("1", "true", "yes")
+        try:
+            fraction = float(os.getenv("SESSION_TOUCH_FRACTION", 0.1))
+        except ValueError:
+            fraction = 0.1
+        self.touch_interval = self.session_duration * fraction
+        try:
+            interval = float(os.getenv("SESSION_REAPER_INTERVAL", 0))
+        except ValueError:
+            interval = 0
+        if interval > 0 and self.session_duration > 0:
+            self.start_reaper(interval)
 
     def create_session(self, user_id=None):
         """
@@ -38,7 +66,17 @@ class SessionExpAuth(SessionAuth):
             'user_id': user_id,
             'created_at': datetime.now()
         }
-        self.user_id_by_session_id[session_id] = session_dictionary
+        if self.session_duration <= 0:
+            self.user_id_by_session_id[session_id] = session_dictionary
+            return session_id
+        now = time.time()
+        deadline = now + self.session_duration
+        session_dictionary['last_seen'] = now
+        session_dictionary['expires_at'] = deadline
+        self.user_id_by_session_id.set(session_id, session_dictionary,
+                                       self.session_duration)
+        self.session_expiry.push(session_id, deadline)
+        self.reap(now, self.reap_batch_size)
         return session_id
 
     def user_id_for_session_id(self, session_id=None):
@@ -59,10 +97,99 @@ class SessionExpAuth(SessionAuth):
         if self.session_duration <= 0:
             return user
 
-        created_at = user_dictionary.get('created_at')
-        if not created_at:
+        expires_at = user_dictionary.get('expires_at')
+        if not expires_at:
             return None
-        duration_in_seconds = timedelta(seconds=self.session_duration)
-        if created_at + duration_in_seconds < datetime.now():
+        now = time.time()
+        if expires_at < now:
+            if self.user_id_by_session_id.pop(session_id) is not None:
+                self.session_counters.inc('expired')
             return None
+        if self.sliding:
+            self.touch_session(session_id, user_dictionary, now)
         return user
+
+    def touch_session(self, session_id, user_dictionary, now):
+        """
+        It slides the expiration of a session, unless its `last_seen` time
+        was refreshed less than `touch_interval` seconds ago
+
+        :param session_id: The session ID
+        :param user_dictionary: The data of the session
+        :param now: The current `time.time()` value
+        """
+        if now - user_dictionary.get('last_seen', 0) < self.touch_interval:
+            self.session_touches.skip()
+            return
+        deadline = now + self.session_duration
+        user_dictionary['last_seen'] = now
+        user_dictionary['expires_at'] = deadline
+        self.user_id_by_session_id.set(session_id, user_dictionary,
+                                       self.session_duration)
+        self.session_expiry.push(session_id, deadline)
+        self.session_touches.touch(session_id, now, deferred=False)
+
+    def reap(self, now: float = None, limit: int = 0) -> int:
+        """
+        It removes the expired sessions from the session store
+
+        :param now: The current `time.time()` value
+        :type now: float
+        :param limit: The maximum number of sessions removed (0 means all)
+        :type limit: int
+        :return: The number of expired sessions popped from the index
+        """
+        if now is None:
+            now = time.time()
+        expired = self.session_expiry.pop_expired(now, limit)
+
+        def is_expired(user_dictionary):
+            """ Check the deadline wasn't pushed back by a touch """
+            return not isinstance(user_dictionary, dict) or \
+                user_dictionary.get('expires_at', 0) <= now
+
+        removed = sum(
+            self.user_id_by_session_id.pop_if(session_id, is_expired)
+            for session_id in expired)
+        if removed:
+            self.session_counters.inc('expired', removed)
+        return len(expired)
+
+    def start_reaper(self, interval: float) -> None:
+        """
+        It starts a daemon thread that reaps expired sessions every
+        `interval` seconds, only one reaper runs per process
+
+        :param interval: The number of seconds between two passes
+        :type interval: float
+        """
+        cls = SessionExpAuth
+        if cls._reaper is not None and cls._reaper.is_alive():
+            return
+        cls._reaper = self.run_every(interval, self.reap, 'session-reaper')
+
+    @staticmethod
+    def run_every(interval: float, task, name: str) -> threading.Thread:
+        """
+        It starts a daemon thread calling `task` every `interval` seconds,
+        an exception of one call is logged and doesn't stop the next ones
+
+        :param interval: The number of seconds between two calls
+        :type interval: float
+        :param task: The callable to run
+        :param name: The name of the thread
+        :type name: str
+        :return: The started thread
+        """
+        def run_forever():
+            """ Run the task until the process exits """
+            while True:
+                time.sleep(interval)
+                try:
+                    task()
+                except Exception as err:
+                    print("{}: {!r}".format(name, err), file=sys.stderr)
+
+        thread = threading.Thread(target=run_forever, name=name, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+""" Shared session server module
+
+A tiny local daemon speaking the subset of the Redis protocol (RESP) used
+by RemoteSessionStore, so every worker process of a deployment sees the
+same sessions. A real Redis server (6.2+) can be used in its place.
+Keys set with a TTL (`SET key value EX seconds`) are never evicted by the
+LRU cap of the store, they are removed when their TTL runs out.
+
+    $ SESSION_STORE_URL=unix:///tmp/sessions.sock \\
+        python3 -m api.v1.auth.session_server
+"""
+import json
+import math
+import os
+import socket
+import socketserver
+import threading
+import time
+from api.v1.auth.session_store import ExpiryIndex, SessionStore
+
+
+def parse_address(url: str):
+    """
+    It parses `unix:///path/to.sock` or `redis://host:port` into an
+    address for the socket module
+
+    :param url: The address of the server
+    :type url: str
+    :return: A (family, address) tuple
+    """
+    if url.startswith('unix://'):
+        return (socket.AF_UNIX, url[len('unix://'):])
+    host, _, port = url.split('://', 1)[-1].rpartition(':')
+    return (socket.AF_INET, (host or '127.0.0.1', int(port or 6379)))
+
+
+def encode_command(*args) -> bytes:
+    """ Encode a command as a RESP array of bulk strings """
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if type(arg) is not bytes:
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+def encode_reply(reply) -> bytes:
+    """ Encode a Python value as a RESP reply """
+    if reply is None:
+        return b'$-1\r\n'
+    if reply is True:
+        return b'+OK\r\n'
+    if type(reply) is int:
+        return b':%d\r\n' % reply
+    if type(reply) is bytes:
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    if type(reply) is list:
+        return b'*%d\r\n' % len(reply) + \
+            b''.join(encode_reply(item) for item in reply)
+    return b'-ERR %s\r\n' % str(reply).encode()
+
+
+def read_reply(stream):
+    """
+    It reads one RESP value from a binary file-like object
+
+    :param stream: The stream to read from
+    :return: bytes, int, list or None, a RESP error raises RuntimeError
+    """
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b'+':
+        return body
+    if kind == b'-':
+        raise RuntimeError(body.decode())
+    if kind == b':':
+        return int(body)
+    if kind == b'$':
+        length = int(body)
+        if length < 0:
+            return None
+        return stream.read(length + 2)[:-2]
+    if kind == b'*':
+        length = int(body)
+        if length < 0:
+            return None
+        return [read_reply(stream) for _ in range(length)]
+    raise RuntimeError("protocol error: {!r}".format(line))
+
+
+class ServerStore():
+    """ Keyspace of the session server.
+
+    Keys set without a TTL live in a bounded SessionStore, where the least
+    recently used ones can be evicted. Keys set with a TTL live in an
+    unbounded SessionStore next to their deadline, and are removed only
+    once the deadline passes, lazily on access and in small batches on
+    every command.
+    """
+    purge_batch_size = 64
+
+    def __init__(self, store: SessionStore = None):
+        """
+        It initializes both stores
+
+        :param store: The store of the keys without a TTL, sized from the
+        environment if None
+        """
+        self.store = store if store is not None else SessionStore.from_env()
+        self.volatile = SessionStore(0)
+        self.expiry = ExpiryIndex()
+
+    def purge(self, now: float) -> None:
+        """ Remove a batch of the keys whose TTL ran out """
+        for key in self.expiry.pop_expired(now, self.purge_batch_size):
+            self.volatile.pop_if(key, lambda entry: entry[0] <= now)
+
+    def set(self, key, value, ttl: float = None) -> None:
+        """ Store `value` under `key`, for `ttl` seconds if it's given """
+        if ttl is None:
+            self.volatile.pop(key)
+            self.store.set(key, value)
+            return
+        deadline = time.monotonic() + ttl
+        self.store.pop(key)
+        self.volatile.set(key, (deadline, value))
+        self.expiry.push(key, deadline)
+
+    def get(self, key):
+        """ Return the value of `key`, or None """
+        entry = self.volatile.get(key)
+        if entry is None:
+            return self.store.get(key)
+        if entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def pop(self, key):
+        """ Remove `key` and return its value, or None """
+        entry = self.volatile.pop(key)
+        if entry is None:
+            return self.store.pop(key)
+        if entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def keys(self) -> list:
+        """ Return every key whose TTL didn't run out """
+        now = time.monotonic()
+        return [key for key, _ in self.store.items()] + \
+            [key for key, entry in self.volatile.items() if entry[0] > now]
+
+    def clear(self) -> None:
+        """ Remove every key """
+        self.store.clear()
+        self.volatile.clear()
+        self.expiry.clear()
+
+    def __contains__(self, key) -> bool:
+        """ Check if `key` exists """
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        """ Return the number of keys, expired ones not purged yet too """
+        return len(self.store) + len(self.volatile)
+
+
+class SessionRequestHandler(socketserver.StreamRequestHandler):
+    """ Serve the commands of one client connection """
+
+    def handle(self):
+        """ Answer commands until the client disconnects """
+        store = self.server.store
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, RuntimeError, ValueError):
+                return
+            if not command:
+                continue
+            name, args = command[0].upper(), command[1:]
+            try:
+                reply = self.execute(store, name, args)
+            except Exception as e:
+                reply = RuntimeError(e)
+            self.wfile.write(encode_reply(reply))
+
+    @staticmethod
+    def execute(store: ServerStore, name: bytes, args: list):
+        """ Run one command against the store and return its reply """
+        store.purge(time.monotonic())
+        if name == b'PING':
+            return True
+        if name == b'GET':
+            return store.get(args[0])
+        if name == b'SET':
+            ttl = None
+            if len(args) == 4 and args[2].upper() in (b'EX', b'PX'):
+                ttl = int(args[3]) / (1 if args[2].upper() == b'EX' else 1000)
+                if ttl <= 0:
+                    return RuntimeError("invalid expire time in 'set'")
+            elif len(args) != 2:
+                return RuntimeError("syntax error")
+            store.set(args[0], args[1], ttl)
+            return True
+        if name == b'GETDEL':
+            return store.pop(args[0])
+        if name == b'DEL':
+            return sum(store.pop(key) is not None for key in args)
+        if name == b'EXISTS':
+            return sum(key in store for key in args)
+        if name == b'MGET':
+            return [store.get(key) for key in args]
+        if name == b'KEYS':
+            return store.keys()
+        if name == b'DBSIZE':
+            return len(store)
+        if name == b'FLUSHDB':
+            store.clear()
+            return True
+        return RuntimeError("unknown command '{}'".format(name.decode()))
+
+
+class SessionTCPServer(socketserver.ThreadingTCPServer):
+    """ Threaded TCP session server """
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SessionUnixServer(socketserver.ThreadingUnixStreamServer):
+    """ Threaded Unix socket session server """
+    daemon_threads = True
+
+
+def serve(url: str, store: SessionStore = None):
+    """
+    It creates a threaded server for `url`, the caller runs it with
+    `serve_forever()`
+
+    :param url: The address to listen on
+    :type url: str
+    :param store: The store of the keys without a TTL, sized from the
+    environment if None
+    :return: The server
+    """
+    family, address = parse_address(url)
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.unlink(address)
+        server_class = SessionUnixServer
+    else:
+        server_class = SessionTCPServer
+    server = server_class(address, SessionRequestHandler)
+    server.store = ServerStore(store)
+    return server
+
+
+class RemoteSessionStore():
+    """ Session store kept in a shared session server.
+
+    It has the interface of SessionStore, values are serialized in JSON
+    and every thread keeps its own connection to the server.
+    """
+
+    def __init__(self, url: str):
+        """
+        It prepares the connections to the server at `url`
+
+        :param url: The address of the server
+        :type url: str
+        """
+        self.url = url
+        self._address = parse_address(url)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _stream(self):
+        """ Return the connection stream of the calling thread """
+        stream = getattr(self._local, 'stream', None)
+        if stream is None:
+            family, address = self._address
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.connect(address)
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            stream = sock.makefile('rwb')
+            self._local.stream = stream
+        return stream
+
+    def execute(self, *args):
+        """
+        It sends one command and returns its reply, reconnecting once if
+        the connection was closed
+
+        :return: The decoded RESP reply
+        """
+        for attempt in range(2):
+            stream = self._stream()
+            try:
+                stream.write(encode_command(*args))
+                stream.flush()
+                return read_reply(stream)
+            except (ConnectionError, OSError):
+                self._local.stream = None
+                if attempt:
+                    raise
+
+    @staticmethod
+    def _load(raw):
+        """ Decode a stored value """
+        return None if raw is None else json.loads(raw)
+
+    def set(self, session_id, value, ttl: float = None) -> None:
+        """ Store `value` under `session_id`, for `ttl` seconds (rounded up
+        to a whole second) if it's given """
+        if ttl is None:
+            self.execute('SET', session_id, json.dumps(value, default=str))
+            return
+        self.execute('SET', session_id, json.dumps(value, default=str),
+                     'EX', max(1, math.ceil(ttl)))
+
+    def get(self, session_id, default=None):
+        """ Return the data of a session or `default` """
+        raw = self.execute('GET', session_id)
+        with self._lock:
+            if raw is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return default if raw is None else self._load(raw)
+
+    def pop(self, session_id, default=None):
+        """ Remove a session and return its data or `default` """
+        raw = self.execute('GETDEL', session_id)
+        return default if raw is None else self._load(raw)
+
+    def pop_if(self, session_id, predicate) -> bool:
+        """ Remove a session if `predicate` holds for its data """
+        raw = self.execute('GET', session_id)
+        if raw is None or not predicate(self._load(raw)):
+            return False
+        return self.execute('DEL', session_id) > 0
+
+    def items(self) -> list:
+        """ Return a snapshot of all (session ID, data) pairs """
+        keys = self.execute('KEYS', '*')
+        if not keys:
+            return []
+        values = self.execute('MGET', *keys)
+        return [(key.decode(), self._load(value))
+                for key, value in zip(keys, values) if value is not None]
+
+    def clear(self) -> None:
+        """ Remove every session """
+        self.execute('FLUSHDB')
+
+    def stats(self) -> dict:
+        """ Return the size of the store and the hit rate of this client """
+        lookups = self._hits + self._misses
+        return {
+            'size': len(self),
+            'url': self.url,
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': self._hits / lookups if lookups else 0.0,
+        }
+
+    def __setitem__(self, session_id, value) -> None:
+        """ Store a session """
+        self.set(session_id, value)
+
+    def __getitem__(self, session_id):
+        """ Return a session, raise KeyError if it doesn't exist """
+        raw = self.execute('GET', session_id)
+        if raw is None:
+            raise KeyError(session_id)
+        return self._load(raw)
+
+    def __delitem__(self, session_id) -> None:
+        """ Remove a session, raise KeyError if it doesn't exist """
+        if not self.execute('DEL', session_id):
+            raise KeyError(session_id)
+
+    def __contains__(self, session_id) -> bool:
+        """ Check if a session exists """
+        return self.execute('EXISTS', session_id) > 0
+
+    def __len__(self) -> int:
+        """ Return the number of stored sessions """
+        return self.execute('DBSIZE')
+
+    def __repr__(self) -> str:
+        """ Represent the store like the dictionary it replaces """
+        return repr(dict(self.items()))
+
+
+if __name__ == "__main__":
+    url = os.getenv("SESSION_STORE_URL", "redis://127.0.0.1:6380")
+    with serve(url) as server:
+        server.serve_forever()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" Session SQLite Auth module"""
+
+from datetime import datetime, timedelta
+import os
+from api.v1.auth.session_db_auth import SessionDBAuth
+from models.user_session import UserSession
+from models.user_session_db import UserSessionDB
+
+
+class SessionSQLiteAuth(SessionDBAuth):
+    """ It's a SessionDBAuth storing sessions in a SQLite database
+    instead of the JSON file of UserSession"""
+
+    def __init__(self):
+        """
+        It opens the database at `SESSION_DB_PATH` with a pool of
+        `SESSION_DB_POOL_SIZE` connections (4), the thread started by
+        SessionDBAuth purges the expired sessions from it
+        """
+        super().__init__()
+        try:
+            pool_size = int(os.getenv("SESSION_DB_POOL_SIZE", 4))
+        except ValueError:
+            pool_size = 4
+        self.session_db = UserSessionDB(
+            os.getenv("SESSION_DB_PATH", ".db_UserSession.sqlite3"),
+            pool_size)
+
+    def find_user_session(self, session_id: str) -> UserSession:
+        """
+        It returns the stored session with the given session ID
+
+        :param session_id: The session ID
+        :return: The UserSession, or None if it doesn't exist
+        """
+        return self.session_db.get(session_id)
+
+    def save_user_session(self, user_session: UserSession) -> None:
+        """
+        It inserts a new session row
+
+        :param user_session: The UserSession to store
+        """
+        self.session_db.add(user_session)
+
+    def remove_user_session(self, user_session: UserSession) -> None:
+        """
+        It deletes a session row
+
+        :param user_session: The UserSession to delete
+        """
+        self.session_db.remove(user_session.session_id)
+
+    def save_touches(self, pending: dict) -> int:
+        """
+        It writes `last_seen` refreshes in one transaction
+
+        :param pending: A dictionary of session ID to `last_seen`
+        :return: The number of sessions updated
+        """
+        return self.session_db.touch_many(pending)
+
+    def session_stats(self) -> dict:
+        """
+        It returns the session counters of this process, counting the rows
+        would scan the table so the number of stored sessions isn't given
+
+        :return: A dictionary of counters
+        """
+        return self.session_counters.snapshot()
+
+    def purge_expired(self) -> int:
+        """
+        It deletes every expired session with one range DELETE on the
+        `last_seen` index in sliding mode, `created_at` otherwise
+
+        :return: The number of sessions deleted
+        """
+        if self.session_duration <= 0:
+            return 0
+        duration = timedelta(seconds=self.session_duration)
+        if self.sliding:
+            purged = self.session_db.purge('last_seen',
+                                           datetime.utcnow() - duration)
+        else:
+            purged = self.session_db.purge('created_at',
+                                           datetime.utcnow() - duration)
+        if purged:
+            self.session_counters.inc('expired', purged)
+        return purged
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+""" Session store module """
+
+import heapq
+import os
+import threading
+from collections import OrderedDict
+
+
+class SessionStore():
+    """ Thread-safe, bounded map of session ID to session data.
+
+    Entries are spread over independent shards, each one an LRU ordered
+    dictionary guarded by its own lock, so concurrent requests only
+    contend when they hash to the same shard.
+    """
+
+    def __init__(self, max_entries: int = 0, shards: int = 16):
+        """
+        It initializes the shards of the store
+
+        :param max_entries: The maximum number of sessions kept, the least
+        recently used ones are evicted past it (0 means no limit)
+        :type max_entries: int
+        :param shards: The number of independently locked shards
+        :type shards: int
+        """
+        max_entries = max(max_entries, 0)
+        shards = max(shards, 1)
+        if max_entries:
+            shards = min(shards, max_entries)
+        self.max_entries = max_entries
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._capacities = [
+            max_entries // shards + (1 if i < max_entries % shards else 0)
+            for i in range(shards)
+        ]
+        self._hits = [0] * shards
+        self._misses = [0] * shards
+        self._evictions = [0] * shards
+
+    @classmethod
+    def from_env(cls, max_entries: int = None) -> 'SessionStore':
+        """
+        It creates a store sized by the environment variables
+        `SESSION_STORE_MAX_ENTRIES` and `SESSION_STORE_SHARDS`
+
+        :param max_entries: The maximum number of entries, overriding
+        `SESSION_STORE_MAX_ENTRIES` (0 means no limit)
+        :type max_entries: int
+        :return: A new SessionStore
+        """
+        if max_entries is None:
+            try:
+                max_entries = int(os.getenv('SESSION_STORE_MAX_ENTRIES',
+                                            100000))
+            except ValueError:
+                max_entries = 100000
+        try:
+            shards = int(os.getenv('SESSION_STORE_SHARDS', 16))
+        except ValueError:
+            shards = 16
+        return cls(max_entries, shards)
+
+    def _index(self, session_id) -> int:
+        """ Return the index of the shard owning `session_id` """
+        return hash(session_id) % len(self._shards)
+
+    def set(self, session_id, value, ttl: float = None) -> None:
+        """
+        It stores `value` under `session_id`, evicting the least recently
+        used session of the shard when it is full
+
+        :param session_id: The session ID
+        :param value: The data of the session
+        :param ttl: Unused, local entries are expired by their owner through
+        an ExpiryIndex, it keeps the interface of RemoteSessionStore
+        """
+        i = self._index(session_id)
+        shard = self._shards[i]
+        with self._locks[i]:
+            shard[session_id] = value
+            shard.move_to_end(session_id)
+            if self.max_entries and len(shard) > self._capacities[i]:
+                shard.popitem(last=False)
+                self._evictions[i] += 1
+
+    def get(self, session_id, default=None):
+        """
+        It returns the data of a session and marks it as recently used
+
+        :param session_id: The session ID
+        :param default: The value returned when the session doesn't exist
+        :return: The data of the session or `default`
+        """
+        i = self._index(session_id)
+        shard = self._shards[i]
+        with self._locks[i]:
+            value = shard.get(session_id, self)
+            if value is self:
+                self._misses[i] += 1
+                return default
+            shard.move_to_end(session_id)
+            self._hits[i] += 1
+            return value
+
+    def pop(self, session_id, default=None):
+        """
+        It removes a session and returns its data
+
+        :param session_id: The session ID
+        :param default: The value returned when the session doesn't exist
+        :return: The data of the removed session or `default`
+        """
+        i = self._index(session_id)
+        with self._locks[i]:
+            return self._shards[i].pop(session_id, default)
+
+    def pop_if(self, session_id, predicate) -> bool:
+        """
+        It removes a session only if `predicate` holds for its data, the
+        check and the removal happen under the same lock
+
+        :param session_id: The session ID
+        :param predicate: A callable taking the data of the session
+        :return: True if the session was removed
+        """
+        i = self._index(session_id)
+        shard = self._shards[i]
+        with self._locks[i]:
+            value = shard.get(session_id, self)
+            if value is self or not predicate(value):
+                return False
+            del shard[session_id]
+            return True
+
+    def items(self) -> list:
+        """ Return a snapshot of all (session ID, data) pairs """
+        result = []
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                result.extend(shard.items())
+        return result
+
+    def clear(self) -> None:
+        """ Remove every session from the store """
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                shard.clear()
+
+    def stats(self) -> dict:
+        """
+        It returns the size, evictions and hit rate of the store
+
+        :return: A dictionary of counters
+        """
+        hits = sum(self._hits)
+        misses = sum(self._misses)
+        lookups = hits + misses
+        return {
+            'size': len(self),
+            'max_entries': self.max_entries,
+            'shards': len(self._shards),
+            'evictions': sum(self._evictions),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+    def __setitem__(self, session_id, value) -> None:
+        """ Store a session """
+        self.set(session_id, value)
+
+    def __getitem__(self, session_id):
+        """ Return a session, raise KeyError if it doesn't exist """
+        value = self.get(session_id, self)
+        if value is self:
+            raise KeyError(session_id)
+        return value
+
+    def __delitem__(self, session_id) -> None:
+        """ Remove a session, raise KeyError if it doesn't exist """
+        if self.pop(session_id, self) is self:
+            raise KeyError(session_id)
+
+    def __contains__(self, session_id) -> bool:
+        """ Check if a session exists without touching its recency """
+        i = self._index(session_id)
+        with self._locks[i]:
+            return session_id in self._shards[i]
+
+    def __len__(self) -> int:
+        """ Return the number of stored sessions """
+        return sum(len(shard) for shard in self._shards)
+
+    def __repr__(self) -> str:
+        """ Represent the store like the dictionary it replaces """
+        return repr(dict(self.items()))
+
+
+class Counters():
+    """ Thread-safe named counters """
+
+    def __init__(self, *names):
+        """ It initializes every counter in `names` to 0 """
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(names, 0)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        """ Increment the counter `name` by `value` """
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        """ Return a copy of every counter """
+        with self._lock:
+            return dict(self._values)
+
+
+def open_session_store(max_entries: int = None):
+    """
+    It returns the session store configured by the environment: the
+    shared session server at `SESSION_STORE_URL` if it is set, otherwise
+    an in-process SessionStore
+
+    :param max_entries: The maximum number of entries of an in-process
+    store, `SESSION_STORE_MAX_ENTRIES` if None (0 means no limit)
+    :type max_entries: int
+    :return: A SessionStore or RemoteSessionStore
+    """
+    url = os.getenv('SESSION_STORE_URL')
+    if url:
+        from api.v1.auth.session_server import RemoteSessionStore
+        return RemoteSessionStore(url)
+    return SessionStore.from_env(max_entries)
+
+
+class ExpiryIndex():
+    """ Min-heap of session deadlines.
+
+    The sessions due for removal are always at the top of the heap and
+    can be popped in O(expired * log n) without scanning the live ones.
+    Deadlines of one index must all come from the same clock.
+    """
+
+    def __init__(self):
+        """ It initializes an empty index """
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def push(self, session_id, deadline: float) -> None:
+        """
+        It records the deadline of a session
+
+        :param session_id: The session ID
+        :param deadline: The clock value the session expires at
+        :type deadline: float
+        """
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, session_id))
+
+    def pop_expired(self, now: float, limit: int = 0) -> list:
+        """
+        It removes and returns the sessions whose deadline has passed
+
+        :param now: The current clock value
+        :type now: float
+        :param limit: The maximum number of sessions popped (0 means all)
+        :type limit: int
+        :return: The list of expired session IDs
+        """
+        expired = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                expired.append(heapq.heappop(heap)[1])
+                if limit and len(expired) >= limit:
+                    break
+        return expired
+
+    def clear(self) -> None:
+        """ Forget every deadline """
+        with self._lock:
+            self._heap.clear()
+
+    def __len__(self) -> int:
+        """ Return the number of tracked deadlines """
+        return len(self._heap)
+
+
+class TouchBuffer():
+    """ Coalesces sliding-expiration refreshes of sessions.
+
+    Refreshes of persisted sessions are kept pending until they are
+    drained and written in one batch, a session touched several times
+    before a flush is written once.
+    """
+
+    def __init__(self):
+        """ It initializes an empty buffer and its counters """
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.touches = 0
+        self.coalesced = 0
+        self.writes = 0
+
+    def skip(self) -> None:
+        """ Record a lookup that didn't need to refresh its session """
+        with self._lock:
+            self.lookups += 1
+
+    def touch(self, session_id, last_seen, deferred: bool = True) -> None:
+        """
+        It records a refresh of the `last_seen` time of a session
+
+        :param session_id: The session ID
+        :param last_seen: The new `last_seen` value
+        :param deferred: Keep the refresh pending until the next `drain`,
+        otherwise count it as already written
+        :type deferred: bool
+        """
+        with self._lock:
+            self.lookups += 1
+            self.touches += 1
+            if not deferred:
+                self.writes += 1
+                return
+            if session_id in self._pending:
+                self.coalesced += 1
+            self._pending[session_id] = last_seen
+
+    def get(self, session_id, default=None):
+        """ Return the pending `last_seen` of a session """
+        return self._pending.get(session_id, default)
+
+    def drain(self) -> dict:
+        """
+        It takes every pending refresh, counting them as one write
+
+        :return: A dictionary of session ID to `last_seen`
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if pending:
+                self.writes += 1
+        return pending
+
+    def stats(self) -> dict:
+        """
+        It returns the counters of the buffer, `writes_avoided` is the
+        number of lookups that didn't turn into a store write
+
+        :return: A dictionary of counters
+        """
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'lookups': self.lookups,
+                'touches': self.touches,
+                'coalesced': self.coalesced,
+                'writes': self.writes,
+                'writes_avoided': self.lookups - self.writes,
+            }
+
+    def __len__(self) -> int:
+        """ Return the number of pending refreshes """
+        return len(self._pending)
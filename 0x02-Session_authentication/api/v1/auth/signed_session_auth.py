@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+""" Signed Session Auth module"""
+
+import base64
+import hashlib
+import hmac
+import os
+import time
+from api.v1.auth.session_exp_auth import SessionExpAuth
+from api.v1.auth.session_store import ExpiryIndex, open_session_store
+
+
+class SignedSessionAuth(SessionExpAuth):
+    """ It's a session manager without server-side session state: the
+    session ID is an HMAC-signed token holding the user ID, the issue
+    time and the expiry, that any worker sharing `SESSION_SECRET` can
+    verify. Revocations are never evicted, each one lasts until its
+    token expires. They are kept on the class, so every instance of the
+    process sees them, and shared by the workers through the session
+    server when `SESSION_STORE_URL` is set"""
+    revoked = open_session_store(max_entries=0)
+    revoked_expiry = ExpiryIndex()
+
+    def __init__(self):
+        """
+        It initializes the session duration and the signing key read from
+        `SESSION_SECRET`, which every worker must share
+        """
+        secret = os.getenv("SESSION_SECRET")
+        if not secret:
+            raise RuntimeError("SESSION_SECRET must be set to use "
+                               "signed_session_auth")
+        super().__init__()
+        self.secret = secret.encode()
+
+    def _sign(self, payload: bytes) -> bytes:
+        """ Return the HMAC-SHA256 of `payload` """
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()
+
+    def create_session(self, user_id: str = None) -> str:
+        """
+        It creates a signed token for a user
+
+        :param user_id: The user ID of the user to create a session for
+        :type user_id: str
+        :return: The token, used as session ID
+        """
+        if user_id is None or type(user_id) is not str:
+            return None
+        issued_at = int(time.time())
+        expires_at = issued_at + self.session_duration \
+            if self.session_duration > 0 else 0
+        payload = "{}:{}:{}".format(user_id, issued_at, expires_at).encode()
+        self.session_counters.inc('created')
+        return "{}.{}".format(
+            base64.urlsafe_b64encode(payload).decode().rstrip('='),
+            base64.urlsafe_b64encode(self._sign(payload)).decode().rstrip('='))
+
+    def verify_session(self, session_id: str) -> tuple:
+        """
+        It checks the signature and the expiry of a token
+
+        :param session_id: The token
+        :type session_id: str
+        :return: The (user_id, issued_at, expires_at) of the token, or None
+        """
+        if not session_id or type(session_id) is not str:
+            return None
+        encoded_payload, _, encoded_signature = session_id.partition('.')
+        try:
+            payload = base64.urlsafe_b64decode(
+                encoded_payload + '=' * (-len(encoded_payload) % 4))
+            signature = base64.urlsafe_b64decode(
+                encoded_signature + '=' * (-len(encoded_signature) % 4))
+            user_id, issued_at, expires_at = \
+                payload.decode().rsplit(':', 2)
+            issued_at, expires_at = int(issued_at), int(expires_at)
+        except Exception:
+            return None
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        if expires_at and expires_at < time.time():
+            return None
+        return (user_id, issued_at, expires_at)
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """
+        If the token is valid and not revoked, return its user ID
+
+        :param session_id: The token
+        :return: The user_id for the token
+        """
+        session = self.verify_session(session_id)
+        if session is None or session_id in self.revoked:
+            return None
+        return session[0]
+
+    def session_stats(self) -> dict:
+        """
+        It returns the session counters and the number of revoked tokens,
+        sessions themselves aren't stored
+
+        :return: A dictionary of counters
+        """
+        stats = self.session_counters.snapshot()
+        stats['revoked'] = len(self.revoked)
+        return stats
+
+    def destroy_session(self, request=None) -> bool:
+        """
+        It revokes the token of the request until it expires, forever if
+        it doesn't expire
+
+        :param request: The request object
+        :return: A boolean value.
+        """
+        if request is None:
+            return False
+        session_id = self.session_cookie(request)
+        session = self.verify_session(session_id)
+        if session is None or session_id in self.revoked:
+            return False
+        now = time.time()
+        for revoked_id in self.revoked_expiry.pop_expired(now):
+            self.revoked.pop(revoked_id)
+        expires_at = session[2]
+        self.revoked.set(session_id, expires_at,
+                         expires_at - now if expires_at else None)
+        if expires_at:
+            self.revoked_expiry.push(session_id, expires_at)
+        self.session_counters.inc('destroyed')
+        return True
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+""" Startup module
+
+Defers the loading of the models out of the import of the API, and, when
+`STARTUP_PROFILE` is set, records how long each module import and each
+model load took.
+"""
+import sys
+import threading
+import time
+
+
+TIMINGS = {'imports': {}, 'models': {}, 'auth': {}}
+_loaded = threading.Event()
+_lock = threading.Lock()
+_warm_up = None
+
+
+class TimedLoader():
+    """ Loader proxy recording the time spent executing a module """
+
+    def __init__(self, loader, name: str):
+        """ Wrap `loader`, loading the module `name` """
+        self._loader = loader
+        self._name = name
+
+    def create_module(self, spec):
+        """ Delegate the creation of the module """
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        """ Execute the module and record its (cumulative) import time """
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            TIMINGS['imports'][self._name] = time.perf_counter() - start
+
+    def __getattr__(self, name):
+        """ Delegate everything else to the wrapped loader """
+        return getattr(self._loader, name)
+
+
+class ImportTimer():
+    """ Meta path finder wrapping the loader of every imported module in
+    a TimedLoader """
+
+    def find_spec(self, fullname, path, target=None):
+        """ Find the spec with the other finders and time its loader """
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if hasattr(spec.loader, 'exec_module'):
+            spec.loader = TimedLoader(spec.loader, fullname)
+        return spec
+
+
+def profile_imports() -> None:
+    """ Start recording the import time of every module imported next """
+    if not any(isinstance(finder, ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, ImportTimer())
+
+
+def profiling() -> bool:
+    """ Check if the import profiler is installed """
+    return any(isinstance(finder, ImportTimer) for finder in sys.meta_path)
+
+
+def load_models() -> None:
+    """ Load every model from its file, timing each one """
+    from models.user import User
+    for model in (User,):
+        start = time.perf_counter()
+        model.load_from_file()
+        TIMINGS['models'][model.__name__] = time.perf_counter() - start
+
+
+def ensure_loaded() -> None:
+    """ Load the models once, blocking until they are loaded """
+    if _loaded.is_set():
+        return
+    with _lock:
+        if _loaded.is_set():
+            return
+        load_models()
+        _loaded.set()
+    if profiling():
+        print_report()
+
+
+def is_ready() -> bool:
+    """ Check if the models are loaded """
+    return _loaded.is_set()
+
+
+def start_warm_up() -> threading.Thread:
+    """ Load the models in a background thread, at most once """
+    global _warm_up
+    with _lock:
+        if _warm_up is None and not _loaded.is_set():
+            _warm_up = threading.Thread(target=ensure_loaded,
+                                        name='warm-up', daemon=True)
+            _warm_up.start()
+    return _warm_up
+
+
+def report(top: int = 15) -> dict:
+    """
+    It returns the slowest module imports, the model loading times and
+    the time spent creating the auth backend, in milliseconds
+
+    :param top: The number of imports reported
+    :type top: int
+    :return: A dictionary of timings
+    """
+    imports = sorted(TIMINGS['imports'].items(), key=lambda item: -item[1])
+    return {
+        'imports': {name: round(s * 1000, 2) for name, s in imports[:top]},
+        'models': {name: round(s * 1000, 2)
+                   for name, s in TIMINGS['models'].items()},
+        'auth': {name: round(s * 1000, 2)
+                 for name, s in TIMINGS['auth'].items()},
+    }
+
+
+def print_report() -> None:
+    """ Print the startup timings on stderr """
+    for section, timings in report().items():
+        for name, ms in timings.items():
+            print("[startup] {} {}: {} ms".format(section, name, ms),
+                  file=sys.stderr)
@@ -1,8 +1,19 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import jsonify, abort, current_app, request
+from os import getenv
 from api.v1.views import app_views
+import hashlib
+import json
+import time
+
+
+try:
+    STATS_TTL = float(getenv('STATS_TTL', 1))
+except ValueError:
+    STATS_TTL = 1.0
+STATS_CACHE = {}
 
 
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
@@ -14,16 +25,73 @@ def status() -> str:
     return jsonify({"status": "OK"})
 
 
+@app_views.route('/ready', methods=['GET'], strict_slashes=False)
+def ready() -> str:
+    """ GET /api/v1/ready
+    Return:
+      - 200 once the models are loaded
+      - 503 while they are loading, the first call starts the loading
+    """
+    from api.v1 import startup
+    if startup.is_ready():
+        return jsonify({"ready": True})
+    startup.start_warm_up()
+    return jsonify({"ready": False}), 503
+
+
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Return:
+      - the metrics of the API in the Prometheus text format
+    """
+    from api.v1.metrics import METRICS
+    return METRICS.render(), 200, \
+        {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @app_views.route('/stats/', strict_slashes=False)
 def stats() -> str:
     """ GET /api/v1/stats
     Return:
-      - the number of each objects
+      - the number of each objects, of sessions and the size of each store
+      - 304 if the `If-None-Match` ETag is still current
+    The response is cached for `STATS_TTL` seconds
+    """
+    now = time.monotonic()
+    entry = STATS_CACHE.get('entry')
+    if entry is None or entry[0] <= now:
+        body = json.dumps(compute_stats(), sort_keys=True)
+        etag = hashlib.sha1(body.encode()).hexdigest()[:16]
+        entry = STATS_CACHE['entry'] = (now + STATS_TTL, body, etag)
+    response = current_app.response_class(entry[1],
+                                          mimetype='application/json')
+    response.set_etag(entry[2])
+    response.cache_control.max_age = int(STATS_TTL)
+    return response.make_conditional(request)
+
+
+def compute_stats() -> dict:
+    """
+    It collects the counters behind /api/v1/stats, all of them are
+    maintained incrementally so no store is scanned
+    :return: A dictionary of counters
     """
+    from api.v1.app import auth
+    from models.base import DATA, FILE_STAMPS
     from models.user import User
     stats = {}
     stats['users'] = User.count()
-    return jsonify(stats)
+    if hasattr(auth, 'session_stats'):
+        stats['sessions'] = auth.session_stats()
+    stats['stores'] = {}
+    for s_class in list(DATA.keys()):
+        stamp = FILE_STAMPS.get(s_class)
+        stats['stores'][s_class] = {
+            'objects': len(DATA[s_class]),
+            'bytes': stamp[1] if stamp else 0,
+        }
+    return stats
 
 
 @app_views.route('/unauthorized', strict_slashes=False)
@@ -1,19 +1,75 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+import hashlib
+import json
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import abort, current_app, jsonify, make_response, request
 from models.user import User
 
 
+def requested_fields() -> tuple:
+    """ Read the `fields` query parameter, abort with 400 on an unknown
+    field
+    Return:
+      - tuple of User attributes, or None for all of them
+    """
+    try:
+        return User.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        abort(make_response(jsonify({'error': str(e)}), 400))
+
+
+def requested_query() -> tuple:
+    """ Read the filters and the `sort` query parameter, abort with 400 on
+    an unknown field or operator or a bad value
+    Return:
+      - tuple of the filters and the sort keys of User.query
+    """
+    try:
+        return (User.parse_filters(request.args.items(multi=True)),
+                User.parse_sort(request.args.get('sort')))
+    except ValueError as e:
+        abort(make_response(jsonify({'error': str(e)}), 400))
+
+
+def conditional_json(etag: str, build):
+    """ Answer 304 if the `If-None-Match` header holds `etag`, otherwise
+    serialize what `build()` returns, tagged with `etag`
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    return response
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - fields: comma separated attributes to return
+      - <attribute>: equal to the value
+      - <attribute>__startswith: starting with the value
+      - <attribute>__gt, __gte, __lt, __lte: compared to the value,
+        `created_at` and `updated_at` given as %Y-%m-%dT%H:%M:%S or
+        %Y-%m-%d
+      - sort: comma separated attributes, `-` prefixed for descending
     Return:
-      - list of all User objects JSON represented
+      - list of the matching User objects JSON represented
+      - 304 if the `If-None-Match` ETag is still current
+      - 400 if a field or an operator is unknown or a value is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    fields = requested_fields()
+    filters, sort = requested_query()
+    etag = User.collection_tag()
+    if fields or filters or sort:
+        query = repr((sorted(filters), sort, fields)).encode()
+        etag = "{};{}".format(etag, hashlib.sha1(query).hexdigest())
+    return conditional_json(
+        etag, lambda: [user.to_json(fields=fields)
+                       for user in User.query(filters, sort)])
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -21,8 +77,12 @@ def view_one_user(user_id: str = None) -> str:
     """ GET /api/v1/users/:id
     Path parameter:
       - User ID
+    Query parameter:
+      - fields (optional): comma separated attributes to return
     Return:
       - User object JSON represented
+      - 304 if the `If-None-Match` ETag is still current
+      - 400 if a field is unknown
       - 404 if the User ID doesn't exist
     """
     if not user_id:
@@ -30,12 +90,15 @@ def view_one_user(user_id: str = None) -> str:
     if user_id == 'me':
         if not request.current_user:
             abort(404)
-        user = User.get(request.current_user.id)
-        return jsonify(user.to_json())
+        user_id = request.current_user.id
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    fields = requested_fields()
+    etag = user.version_tag()
+    if fields:
+        etag = "{};{}".format(etag, ','.join(fields))
+    return conditional_json(etag, lambda: user.to_json(fields=fields))
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -125,3 +188,133 @@ def update_user(user_id: str = None) -> str:
         user.last_name = rj.get('last_name')
     user.save()
     return jsonify(user.to_json()), 200
+
+
+def bulk_items() -> list:
+    """ Read the items of a bulk request, from a JSON array or from NDJSON
+    (one JSON value per line), a line that isn't JSON becomes None
+    Return:
+      - list of items, or None if the body can't be read
+    """
+    rj = request.get_json(silent=True)
+    if type(rj) is list:
+        return rj
+    if rj is not None:
+        return None
+    items = []
+    for line in request.get_data(as_text=True).splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(None)
+    return items or None
+
+
+def bulk_response(results: list) -> str:
+    """ Serialize the per-item results of a bulk request, in the order of
+    the items
+    """
+    return jsonify([{'status': status, 'user': value} if status < 400
+                    else {'status': status, 'error': value}
+                    for status, value in results]), 200
+
+
+@app_views.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """ POST /api/v1/users/bulk
+    Body: JSON array or NDJSON of objects with the fields of
+    POST /api/v1/users
+    Return:
+      - list of {status, user} or {status, error}, one per item, every
+        User created is written with one save of the file
+      - 400 if the body can't be read
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results, users = [], []
+    for item in items:
+        error_msg = None
+        if type(item) is not dict:
+            error_msg = "Wrong format"
+        elif item.get("email", "") == "":
+            error_msg = "email missing"
+        elif item.get("password", "") == "":
+            error_msg = "password missing"
+        if error_msg is not None:
+            results.append((400, error_msg))
+            continue
+        user = User()
+        user.email = item.get("email")
+        user.password = item.get("password")
+        user.first_name = item.get("first_name")
+        user.last_name = item.get("last_name")
+        users.append(user)
+        results.append((201, user))
+    try:
+        User.save_many(users)
+    except Exception as e:
+        return jsonify({'error': "Can't create Users: {}".format(e)}), 400
+    return bulk_response([(status, value.to_json() if status < 400 else value)
+                          for status, value in results])
+
+
+@app_views.route('/users/bulk', methods=['PUT'], strict_slashes=False)
+def update_users() -> str:
+    """ PUT /api/v1/users/bulk
+    Body: JSON array or NDJSON of objects with an `id` and the fields of
+    PUT /api/v1/users/:id
+    Return:
+      - list of {status, user} or {status, error}, one per item, every
+        User updated is written with one save of the file
+      - 400 if the body can't be read
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results, users = [], {}
+    for item in items:
+        if type(item) is not dict:
+            results.append((400, "Wrong format"))
+            continue
+        user = User.get(item.get('id'))
+        if user is None:
+            results.append((404, "Not found"))
+            continue
+        if item.get('first_name') is not None:
+            user.first_name = item.get('first_name')
+        if item.get('last_name') is not None:
+            user.last_name = item.get('last_name')
+        users[user.id] = user
+        results.append((200, user))
+    User.save_many(users.values())
+    return bulk_response([(status, value.to_json() if status < 400 else value)
+                          for status, value in results])
+
+
+@app_views.route('/users/bulk', methods=['DELETE'], strict_slashes=False)
+def delete_users() -> str:
+    """ DELETE /api/v1/users/bulk
+    Body: JSON array or NDJSON of User IDs, or of objects with an `id`
+    Return:
+      - list of {status, user} or {status, error}, one per item, the user
+        of a deleted User is empty, and all are removed with one save of
+        the file
+      - 400 if the body can't be read
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results, users = [], {}
+    for item in items:
+        user_id = item.get('id') if type(item) is dict else item
+        user = User.get(user_id) if type(user_id) is str else None
+        if user is None or user.id in users:
+            results.append((404, "Not found"))
+            continue
+        users[user.id] = user
+        results.append((200, {}))
+    User.remove_many(users.values())
+    return bulk_response(results)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+""" Test of the ETag of GET /api/v1/users with query parameters
+
+    $ ./etag_test.py
+
+It creates two users in a temporary directory and queries the API through
+the Flask test client without authentication. It checks that a value
+holding a `"` or non-ASCII characters gets a 200 with an ASCII ETag, that
+the same query written in another order or encoding gets the same ETag,
+that another query gets another one, and that the ETag answers a 304.
+"""
+import os
+import sys
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def get(client, query_string: str, etag: str = None) -> tuple:
+    """ GET /api/v1/users with `query_string`, return the status and the
+    ETag header
+    """
+    headers = {'If-None-Match': etag} if etag else {}
+    response = client.get('/api/v1/users', query_string=query_string,
+                          headers=headers)
+    return response.status_code, response.headers.get('ETag')
+
+
+def main() -> None:
+    """ Run the test, exit with an AssertionError if it fails """
+    os.environ.pop('AUTH_TYPE', None)
+    sys.path.insert(0, ROOT)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        from models.user import User
+        User.load_from_file()
+        for email, first_name in (('quote@hbtn.io', '"x'),
+                                  ('accent@hbtn.io', 'é')):
+            user = User()
+            user.email = email
+            user.password = "pwd"
+            user.first_name = first_name
+            user.save()
+        from api.v1.app import app
+        client = app.test_client()
+
+        for query_string in ('first_name="x', 'first_name=%22x',
+                             'first_name=é', 'fields=email,first_name"'):
+            status, etag = get(client, query_string)
+            assert status in (200, 400), \
+                "{!r} answered {}".format(query_string, status)
+            if status == 200:
+                assert etag and etag.isascii(), \
+                    "{!r} tagged {!r}".format(query_string, etag)
+            print("{!r}: {} {}".format(query_string, status, etag))
+
+        _, etag = get(client, 'first_name="x')
+        assert get(client, 'first_name=%22x')[1] == etag
+        _, etag = get(client, 'email=quote@hbtn.io&first_name="x')
+        assert get(client, 'first_name="x&email=quote%40hbtn.io')[1] == etag
+        assert get(client, 'first_name=é')[1] != etag
+        assert get(client, 'first_name=é', etag)[0] == 200
+        assert get(client, 'first_name="x&email=quote@hbtn.io',
+                   etag)[0] == 304
+        print("equal queries share their ETag, it answers a 304")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+""" Load test of GET /api/v1/users/me under WSGI threads and under ASGI
+
+    $ ./load_test.py [cores] [clients] [seconds]
+
+It creates a user in a temporary directory, then starts the API with
+AUTH_TYPE=session_auth twice, with the threaded Flask server and with
+uvicorn (api.v1.asgi), both pinned to the first `cores` CPUs (1 by
+default). Each time it logs in, sends GET /api/v1/users/me from `clients`
+keep-alive connections (16) for `seconds` seconds (10), and prints the
+p50 and p99 latencies and the throughput.
+"""
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+EMAIL = "load@hbtn.io"
+PASSWORD = "load pwd"
+SESSION_NAME = "_my_session_id"
+
+
+def create_user(directory: str) -> None:
+    """ Store the user of the test in `directory` """
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        from models.user import User
+        User.load_from_file()
+        user = User()
+        user.email = EMAIL
+        user.password = PASSWORD
+        user.save()
+    finally:
+        os.chdir(cwd)
+
+
+def start_server(mode: str, port: int, cpus: set,
+                 directory: str) -> subprocess.Popen:
+    """ Start the API in `mode` ('wsgi' or 'asgi') pinned to `cpus` """
+    env = dict(os.environ, PYTHONPATH=ROOT, AUTH_TYPE='session_auth',
+               SESSION_NAME=SESSION_NAME, API_HOST='127.0.0.1',
+               API_PORT=str(port))
+    if mode == 'wsgi':
+        command = [sys.executable, '-m', 'api.v1.app']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'api.v1.asgi:application',
+                   '--port', str(port), '--log-level', 'warning',
+                   '--no-access-log']
+    server = subprocess.Popen(
+        command, cwd=directory, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        preexec_fn=lambda: os.sched_setaffinity(0, cpus))
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', '/api/v1/status')
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("{} server didn't start".format(mode))
+
+
+def log_in(port: int) -> str:
+    """ Log the user in and return the session cookie header """
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request(
+        'POST', '/api/v1/auth_session/login',
+        urllib.parse.urlencode({'email': EMAIL, 'password': PASSWORD}),
+        {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    for name, value in response.getheaders():
+        if name.lower() == 'set-cookie':
+            return value.split(';', 1)[0]
+    raise RuntimeError("login failed: {}".format(response.status))
+
+
+def run_clients(port: int, cookie: str, clients: int,
+                seconds: float) -> tuple:
+    """ Send requests from `clients` connections for `seconds` seconds,
+    return the sorted latencies and the number of errors """
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        """ Send requests on one keep-alive connection """
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        mine, failed = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', '/api/v1/users/me',
+                                   headers={'Cookie': cookie})
+                response = connection.getresponse()
+                response.read()
+            except OSError:
+                connection.close()
+                failed += 1
+                continue
+            if response.status != 200:
+                failed += 1
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors[0]
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    """ Return the latency below which `fraction` of the requests ran """
+    if not latencies:
+        return float('nan')
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def main() -> None:
+    """ Run the load test in both modes and print the results """
+    cores = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    cpus = set(sorted(os.sched_getaffinity(0))[:cores])
+    print("{} core(s), {} clients, {} s".format(len(cpus), clients, seconds))
+    print("{:<5} {:>10} {:>10} {:>10} {:>7}".format(
+        'mode', 'p50 ms', 'p99 ms', 'req/s', 'errors'))
+    with tempfile.TemporaryDirectory() as directory:
+        create_user(directory)
+        for port, mode in ((5051, 'wsgi'), (5052, 'asgi')):
+            server = start_server(mode, port, cpus, directory)
+            try:
+                cookie = log_in(port)
+                latencies, errors = run_clients(port, cookie, clients,
+                                                seconds)
+            finally:
+                server.terminate()
+                server.wait()
+            print("{:<5} {:>10.2f} {:>10.2f} {:>10.0f} {:>7}".format(
+                mode, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000,
+                len(latencies) / seconds, errors))
+
+
+if __name__ == "__main__":
+    main()
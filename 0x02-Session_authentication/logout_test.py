@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+""" End to end test of the logout of every session AUTH_TYPE
+
+    $ ./logout_test.py [auth_type...]
+
+It creates a user in a temporary directory, then for each session
+`auth_type` (all of them by default) starts the API the way the README
+does, with `python3 -m api.v1.app`, logs in, checks GET /api/v1/users/me
+answers 200, logs out, and checks the same cookie now gets a 403.
+"""
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+EMAIL = "logout@hbtn.io"
+PASSWORD = "logout pwd"
+SESSION_NAME = "_my_session_id"
+PORT = 5053
+AUTH_TYPES = ('session_auth', 'session_exp_auth', 'session_db_auth',
+              'session_sqlite_auth', 'signed_session_auth')
+
+
+def create_user(directory: str) -> None:
+    """ Store the user of the test in `directory` """
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        from models.user import User
+        User.load_from_file()
+        user = User()
+        user.email = EMAIL
+        user.password = PASSWORD
+        user.save()
+    finally:
+        os.chdir(cwd)
+
+
+def start_server(auth_type: str, directory: str) -> subprocess.Popen:
+    """ Start the API with `auth_type` and wait until it answers """
+    env = dict(os.environ, PYTHONPATH=ROOT, AUTH_TYPE=auth_type,
+               SESSION_NAME=SESSION_NAME, SESSION_DURATION='60',
+               SESSION_SECRET='logout test secret', API_HOST='127.0.0.1',
+               API_PORT=str(PORT))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'api.v1.app'], cwd=directory, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            status, _ = request('GET', '/api/v1/status')
+            if status == 200:
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("{} server didn't start".format(auth_type))
+
+
+def request(method: str, path: str, cookie: str = None,
+            form: dict = None) -> tuple:
+    """ Send a request, return its status and its Set-Cookie header """
+    connection = http.client.HTTPConnection('127.0.0.1', PORT)
+    headers = {'Cookie': cookie} if cookie else {}
+    body = None
+    if form is not None:
+        body = urllib.parse.urlencode(form)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    connection.request(method, path, body, headers)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status, response.getheader('Set-Cookie')
+
+
+def check_logout(auth_type: str) -> None:
+    """ Log in, log out and reuse the cookie against the running API """
+    status, set_cookie = request('POST', '/api/v1/auth_session/login',
+                                 form={'email': EMAIL,
+                                       'password': PASSWORD})
+    assert status == 200 and set_cookie, \
+        "{}: login answered {}".format(auth_type, status)
+    cookie = set_cookie.split(';', 1)[0]
+    status, _ = request('GET', '/api/v1/users/me', cookie)
+    assert status == 200, "{}: /users/me answered {}".format(auth_type,
+                                                             status)
+    status, _ = request('DELETE', '/api/v1/auth_session/logout', cookie)
+    assert status == 200, "{}: logout answered {}".format(auth_type, status)
+    status, _ = request('GET', '/api/v1/users/me', cookie)
+    assert status == 403, \
+        "{}: /users/me answered {} after the logout".format(auth_type,
+                                                            status)
+
+
+def main() -> None:
+    """ Run the test for each AUTH_TYPE, exit with an AssertionError if
+    one of them still accepts a logged out cookie """
+    auth_types = sys.argv[1:] or AUTH_TYPES
+    with tempfile.TemporaryDirectory() as directory:
+        create_user(directory)
+        for auth_type in auth_types:
+            server = start_server(auth_type, directory)
+            try:
+                check_logout(auth_type)
+            finally:
+                server.terminate()
+                server.wait()
+            print("{}: logged out cookie refused".format(auth_type))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,146 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right
 from datetime import datetime
 from typing import TypeVar, List, Iterable
 from os import path
+import itertools
 import json
+import os
+import threading
+import time
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+FILE_STAMPS = {}
+WRITE_STATS = {}
+MUTATIONS = {}
+PUBLIC_FIELDS = {}
+INDEXES = {}
+INDEXABLE = (str, datetime)
+OPERATORS = ('eq', 'startswith', 'gt', 'gte', 'lt', 'lte')
+_MUTATION_SEQUENCE = itertools.count(1)
+STORAGE_LOCK = threading.RLock()
+
+
+def file_stamp(file_path: str) -> tuple:
+    """ Return the (mtime, size) of a file, or None if it doesn't exist
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def matches(value, op: str, operand) -> bool:
+    """ Check if `value` satisfies the filter `op` `operand`
+    """
+    if op == 'eq':
+        return value == operand
+    if type(value) is not type(operand):
+        return False
+    if op == 'startswith':
+        return value.startswith(operand)
+    if op == 'gt':
+        return value > operand
+    if op == 'gte':
+        return value >= operand
+    if op == 'lt':
+        return value < operand
+    return value <= operand
+
+
+def sort_key(value) -> tuple:
+    """ Order any attribute values, None last and one type after the other
+    """
+    return (value is None, type(value).__name__, value)
+
+
+class Index():
+    """ Hashed and sorted index of one attribute of the objects of a class,
+    only string and datetime values are indexed
+    """
+
+    def __init__(self, field: str):
+        """ Initialize an empty index of `field`
+        """
+        self.field = field
+        self.values = {}
+        self.hashed = {}
+        self.ordered = {}
+
+    def build(self, objs: Iterable[TypeVar('Base')]):
+        """ Index all `objs` at once, sorting each type of values once
+        """
+        self.values, self.hashed, pairs = {}, {}, {}
+        for obj in objs:
+            value = getattr(obj, self.field, None)
+            if type(value) not in INDEXABLE:
+                continue
+            self.values[obj.id] = value
+            self.hashed.setdefault(value, {})[obj.id] = None
+            pairs.setdefault(type(value), []).append((value, obj.id))
+        self.ordered = {}
+        for kind, kind_pairs in pairs.items():
+            kind_pairs.sort()
+            self.ordered[kind] = ([value for value, _ in kind_pairs],
+                                  [obj_id for _, obj_id in kind_pairs])
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index the current value of the attribute of `obj`
+        """
+        self.discard(obj.id)
+        value = getattr(obj, self.field, None)
+        if type(value) not in INDEXABLE:
+            return
+        self.values[obj.id] = value
+        self.hashed.setdefault(value, {})[obj.id] = None
+        keys, ids = self.ordered.setdefault(type(value), ([], []))
+        i = bisect_right(keys, value)
+        keys.insert(i, value)
+        ids.insert(i, obj.id)
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        value = self.values.pop(obj_id, None)
+        if value is None:
+            return
+        same = self.hashed[value]
+        del same[obj_id]
+        if not same:
+            del self.hashed[value]
+        keys, ids = self.ordered[type(value)]
+        for i in range(bisect_left(keys, value), bisect_right(keys, value)):
+            if ids[i] == obj_id:
+                del keys[i]
+                del ids[i]
+                return
+
+    def lookup(self, op: str, operand) -> list:
+        """ Return the IDs of the objects matching `op` `operand`, ordered
+        by value, or None if the index can't answer
+        """
+        if type(operand) not in INDEXABLE:
+            return None
+        if op == 'eq':
+            return list(self.hashed.get(operand, ()))
+        keys, ids = self.ordered.get(type(operand), ([], []))
+        if op == 'startswith':
+            start = end = bisect_left(keys, operand)
+            while end < len(keys) and keys[end].startswith(operand):
+                end += 1
+        elif op in ('gt', 'gte'):
+            bisect = bisect_right if op == 'gt' else bisect_left
+            start, end = bisect(keys, operand), len(keys)
+        else:
+            bisect = bisect_left if op == 'lt' else bisect_right
+            start, end = 0, bisect(keys, operand)
+        return ids[start:end]
 
 
 class Base():
@@ -44,10 +175,20 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+    def to_json(self, for_serialization: bool = False,
+                fields: Iterable[str] = None) -> dict:
+        """ Convert the object a JSON dictionary, only the attributes in
+        `fields` if it's given
         """
         result = {}
+        if fields is not None:
+            for key in fields:
+                value = self.__dict__.get(key)
+                if type(value) is datetime:
+                    result[key] = value.strftime(TIMESTAMP_FORMAT)
+                else:
+                    result[key] = value
+            return result
         for key, value in self.__dict__.items():
             if not for_serialization and key[0] == '_':
                 continue
@@ -57,49 +198,203 @@ class Base():
                 result[key] = value
         return result
 
+    @classmethod
+    def public_fields(cls) -> tuple:
+        """ Return the names of the public attributes of the class, computed
+        once from a new instance
+        """
+        s_class = cls.__name__
+        fields = PUBLIC_FIELDS.get(s_class)
+        if fields is None:
+            fields = tuple(key for key in cls().__dict__ if key[0] != '_')
+            PUBLIC_FIELDS[s_class] = fields
+        return fields
+
+    @classmethod
+    def parse_fields(cls, fields: str) -> tuple:
+        """ Parse a comma separated list of public attributes, None if it's
+        empty, raise ValueError on an unknown attribute
+        """
+        if not fields:
+            return None
+        public = cls.public_fields()
+        names = tuple(dict.fromkeys(
+            name.strip() for name in fields.split(',') if name.strip()))
+        for name in names:
+            if name not in public:
+                raise ValueError("unknown field: {}".format(name))
+        return names or None
+
+    @classmethod
+    def parse_filters(cls, args: Iterable[tuple]) -> list:
+        """ Parse (`field` or `field__op`, value) query parameters into
+        (field, op, value) filters, the parameters of other names are
+        ignored, raise ValueError on an unknown operator or bad value
+        """
+        public = cls.public_fields()
+        filters = []
+        for key, value in args:
+            field, _, op = key.partition('__')
+            if field not in public:
+                continue
+            op = op or 'eq'
+            if op not in OPERATORS:
+                raise ValueError("unknown operator: {}".format(key))
+            if field in ('created_at', 'updated_at'):
+                try:
+                    value = datetime.strptime(value, TIMESTAMP_FORMAT)
+                except ValueError:
+                    value = datetime.strptime(value, "%Y-%m-%d")
+                if op == 'startswith':
+                    raise ValueError("unknown operator: {}".format(key))
+            filters.append((field, op, value))
+        return filters
+
+    @classmethod
+    def parse_sort(cls, sort: str) -> list:
+        """ Parse a comma separated list of public attributes, descending
+        if prefixed by `-`, into (field, descending) pairs
+        """
+        if not sort:
+            return []
+        public = cls.public_fields()
+        keys = []
+        for name in sort.split(','):
+            name = name.strip()
+            field = name.lstrip('-')
+            if field not in public:
+                raise ValueError("unknown field: {}".format(field))
+            keys.append((field, name.startswith('-')))
+        return keys
+
+    @classmethod
+    def build_indexes(cls):
+        """ Rebuild the indexes of the `indexed_fields` of the class
+        """
+        s_class = cls.__name__
+        objs = list(DATA.get(s_class, {}).values())
+        indexes = {}
+        for field in getattr(cls, 'indexed_fields', ()):
+            indexes[field] = Index(field)
+            indexes[field].build(objs)
+        INDEXES[s_class] = indexes
+
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file, the indexes are rebuilt even when
+        the file is missing so they never point at unloaded objects
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        with STORAGE_LOCK:
+            DATA[s_class] = {}
+            MUTATIONS[s_class] = next(_MUTATION_SEQUENCE)
+            FILE_STAMPS[s_class] = file_stamp(file_path)
+            if path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        DATA[s_class][obj_id] = cls(**obj_json)
+            cls.build_indexes()
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def reload_if_changed(cls) -> bool:
+        """ Load all objects from file if it was written by someone else
+        since the last load or save
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        stamp = file_stamp(file_path)
+        if s_class in FILE_STAMPS and FILE_STAMPS[s_class] == stamp:
+            return False
+        cls.load_from_file()
+        return True
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Save all objects to file, under the storage lock so no thread
+        changes the objects while they are serialized and written
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with STORAGE_LOCK:
+            objs_json = {}
+            for obj_id, obj in DATA[s_class].items():
+                objs_json[obj_id] = obj.to_json(True)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+            start = time.perf_counter()
+            content = json.dumps(objs_json)
+            with open(file_path, 'w') as f:
+                f.write(content)
+            FILE_STAMPS[s_class] = file_stamp(file_path)
+            stats = WRITE_STATS.setdefault(s_class, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+            stats[2] += len(content)
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        with STORAGE_LOCK:
+            self.updated_at = datetime.utcnow()
+            DATA[s_class][self.id] = self
+            for index in INDEXES.get(s_class, {}).values():
+                index.add(self)
+            MUTATIONS[s_class] = next(_MUTATION_SEQUENCE)
+            self.__class__.save_to_file()
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with STORAGE_LOCK:
+            if DATA[s_class].get(self.id) is not None:
+                del DATA[s_class][self.id]
+                for index in INDEXES.get(s_class, {}).values():
+                    index.discard(self.id)
+                MUTATIONS[s_class] = next(_MUTATION_SEQUENCE)
+                self.__class__.save_to_file()
+
+    @classmethod
+    def save_many(cls, objs: Iterable[TypeVar('Base')]) -> int:
+        """ Save several objects with one write of the file, return how
+        many were saved
+        """
+        s_class = cls.__name__
+        now = datetime.utcnow()
+        saved = 0
+        with STORAGE_LOCK:
+            indexes = INDEXES.get(s_class, {}).values()
+            for obj in objs:
+                obj.updated_at = now
+                DATA[s_class][obj.id] = obj
+                for index in indexes:
+                    index.add(obj)
+                saved += 1
+            if saved:
+                MUTATIONS[s_class] = next(_MUTATION_SEQUENCE)
+                cls.save_to_file()
+        return saved
+
+    @classmethod
+    def remove_many(cls, objs: Iterable[TypeVar('Base')]) -> int:
+        """ Remove several objects with one write of the file, return how
+        many were removed
+        """
+        s_class = cls.__name__
+        removed = 0
+        with STORAGE_LOCK:
+            indexes = INDEXES.get(s_class, {}).values()
+            for obj in objs:
+                if DATA[s_class].pop(obj.id, None) is not None:
+                    for index in indexes:
+                        index.discard(obj.id)
+                    removed += 1
+            if removed:
+                MUTATIONS[s_class] = next(_MUTATION_SEQUENCE)
+                cls.save_to_file()
+        return removed
 
     @classmethod
     def count(cls) -> int:
@@ -108,6 +403,27 @@ class Base():
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
+    @classmethod
+    def mutation(cls) -> int:
+        """ Return the sequence number of the last change made to the
+        objects of the class, it grows with every save, remove and load
+        """
+        return MUTATIONS.get(cls.__name__, 0)
+
+    @classmethod
+    def collection_tag(cls) -> str:
+        """ Return a version tag of all the objects of the class, the stamp
+        of the file tells apart the same sequence number across restarts
+        """
+        stamp = FILE_STAMPS.get(cls.__name__) or (0, 0)
+        return "{}-{:x}-{:x}".format(cls.__name__, stamp[0], cls.mutation())
+
+    def version_tag(self) -> str:
+        """ Return a version tag of the object, it changes on every save
+        """
+        return "{}-{:x}".format(self.id,
+                                int(self.updated_at.timestamp() * 1000000))
+
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
         """ Return all objects
@@ -125,14 +441,42 @@ class Base():
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
+        return cls.query([(k, 'eq', v) for k, v in attributes.items()])
 
-        return list(filter(_search, DATA[s_class].values()))
+    @classmethod
+    def query(cls, filters: Iterable[tuple] = (),
+              sort: Iterable[tuple] = ()) -> List[TypeVar('Base')]:
+        """ Return the objects matching all (field, op, value) `filters`,
+        sorted by the (field, descending) `sort` keys. The candidates come
+        from the most selective index able to answer, and from a scan of
+        all objects when no filter is indexed
+        """
+        s_class = cls.__name__
+        objs = DATA[s_class]
+        indexes = INDEXES.get(s_class, {})
+        filters = list(filters)
+        candidates = []
+        for field, op, value in filters:
+            if field == 'id' and op == 'eq':
+                ids = [value] if type(value) is str else None
+            elif field in indexes:
+                ids = indexes[field].lookup(op, value)
+            else:
+                ids = None
+            if ids is not None:
+                candidates.append(ids)
+        if candidates:
+            candidates.sort(key=len)
+            others = [set(ids) for ids in candidates[1:]]
+            found = [objs[obj_id] for obj_id in candidates[0]
+                     if obj_id in objs and
+                     all(obj_id in ids for ids in others)]
+        else:
+            found = objs.values()
+        result = [obj for obj in found
+                  if all(matches(getattr(obj, field, None), op, value)
+                         for field, op, value in filters)]
+        for field, descending in reversed(list(sort)):
+            result.sort(key=lambda obj: sort_key(getattr(obj, field, None)),
+                        reverse=descending)
+        return result
@@ -1,16 +1,59 @@
 #!/usr/bin/env python3
 """ Session user  module"""
 
-from models.base import Base
+from datetime import datetime
+from models.base import Base, STORAGE_LOCK, TIMESTAMP_FORMAT
 
 
 class UserSession(Base):
     """ > The UserSession class is a child of the Base
     class and it has two attributes: user_id and
     session_id"""
+    _by_session_id = {}
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a UserSession instance """
         super().__init__(*args, **kwargs)
         self.user_id = kwargs.get('user_id', None)
         self.session_id = kwargs.get('session_id', None)
+        self.last_seen = kwargs.get('last_seen', None)
+        if type(self.last_seen) is str:
+            self.last_seen = datetime.strptime(self.last_seen,
+                                               TIMESTAMP_FORMAT)
+
+    @classmethod
+    def load_from_file(cls):
+        """ Load all sessions from file and index them by session_id """
+        with STORAGE_LOCK:
+            super().load_from_file()
+            cls._by_session_id = {
+                user_session.session_id: user_session
+                for user_session in cls.all()
+            }
+
+    @classmethod
+    def get_by_session_id(cls, session_id: str) -> 'UserSession':
+        """ Return the session with the given session_id, or None """
+        return cls._by_session_id.get(session_id)
+
+    def save(self):
+        """ Save current session and index it """
+        with STORAGE_LOCK:
+            super().save()
+            self.__class__._by_session_id[self.session_id] = self
+
+    @classmethod
+    def remove_many(cls, objs) -> int:
+        """ Remove several sessions with one write and unindex them """
+        objs = list(objs)
+        with STORAGE_LOCK:
+            removed = super().remove_many(objs)
+            for user_session in objs:
+                cls._by_session_id.pop(user_session.session_id, None)
+        return removed
+
+    def remove(self):
+        """ Remove current session and unindex it """
+        with STORAGE_LOCK:
+            super().remove()
+            self.__class__._by_session_id.pop(self.session_id, None)
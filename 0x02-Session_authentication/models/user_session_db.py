@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+""" SQLite storage of user sessions
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import queue
+import sqlite3
+import time
+from models.base import TIMESTAMP_FORMAT
+from models.user_session import UserSession
+
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS user_sessions ("
+    " id TEXT PRIMARY KEY,"
+    " session_id TEXT NOT NULL,"
+    " user_id TEXT NOT NULL,"
+    " created_at TEXT NOT NULL,"
+    " updated_at TEXT NOT NULL,"
+    " last_seen TEXT NOT NULL)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_user_sessions_session_id"
+    " ON user_sessions (session_id)",
+    "CREATE INDEX IF NOT EXISTS ix_user_sessions_created_at"
+    " ON user_sessions (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_user_sessions_last_seen"
+    " ON user_sessions (last_seen)",
+)
+COLUMNS = ('id', 'session_id', 'user_id', 'created_at', 'updated_at',
+           'last_seen')
+
+
+class UserSessionDB():
+    """ UserSession storage in a SQLite database in WAL mode.
+
+    Operations check a connection out of a small pool and give it back,
+    so the statements below stay prepared in the statement cache of the
+    pooled connections even when every request runs on a new thread, and
+    readers never share a cursor with writers. At most `pool_size` idle
+    connections are kept, the extra ones are closed.
+    """
+
+    def __init__(self, db_path: str = ".db_UserSession.sqlite3",
+                 pool_size: int = 4):
+        """
+        It creates the table and its indexes if they don't exist
+
+        :param db_path: The path of the SQLite database
+        :type db_path: str
+        :param pool_size: The number of idle connections kept
+        :type pool_size: int
+        """
+        self.db_path = db_path
+        self._pool = queue.LifoQueue(maxsize=max(pool_size, 1))
+        self._counted = None
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+
+    def _connect(self) -> sqlite3.Connection:
+        """ Open a new connection to the database """
+        conn = sqlite3.connect(self.db_path, timeout=30,
+                               cached_statements=64,
+                               check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """ Check a connection out of the pool, a new one if it's empty,
+        and give it back or close it if the pool is full """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self) -> None:
+        """ Close the idle connections of the pool """
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def add(self, user_session: UserSession) -> None:
+        """
+        It inserts a session
+
+        :param user_session: The UserSession to insert
+        """
+        row = user_session.to_json()
+        row['last_seen'] = row.get('last_seen') or row['created_at']
+        with self._connection() as conn, conn:
+            conn.execute(
+                "INSERT INTO user_sessions (id, session_id, user_id,"
+                " created_at, updated_at, last_seen)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [row[column] for column in COLUMNS])
+
+    def get(self, session_id: str) -> UserSession:
+        """
+        It returns the session with the given session ID
+
+        :param session_id: The session ID
+        :return: The UserSession, or None if it doesn't exist
+        """
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT id, session_id, user_id, created_at, updated_at,"
+                " last_seen FROM user_sessions WHERE session_id = ?",
+                (session_id,)).fetchone()
+        if row is None:
+            return None
+        return UserSession(**dict(zip(COLUMNS, row)))
+
+    def remove(self, session_id: str) -> bool:
+        """
+        It deletes the session with the given session ID
+
+        :param session_id: The session ID
+        :return: True if a session was deleted
+        """
+        with self._connection() as conn, conn:
+            cursor = conn.execute(
+                "DELETE FROM user_sessions WHERE session_id = ?",
+                (session_id,))
+        return cursor.rowcount > 0
+
+    def touch_many(self, last_seen_by_session_id: dict) -> int:
+        """
+        It updates the `last_seen` time of many sessions in one transaction
+
+        :param last_seen_by_session_id: A dictionary of session ID to
+        `last_seen` datetime
+        :return: The number of sessions updated
+        """
+        rows = [(last_seen.strftime(TIMESTAMP_FORMAT), session_id)
+                for session_id, last_seen in last_seen_by_session_id.items()]
+        with self._connection() as conn, conn:
+            cursor = conn.executemany(
+                "UPDATE user_sessions SET last_seen = ?"
+                " WHERE session_id = ?", rows)
+        return cursor.rowcount
+
+    def purge(self, column: str, before: datetime) -> int:
+        """
+        It deletes in bulk the sessions whose `created_at` or `last_seen`
+        is older than `before`, using the index on that column
+
+        :param column: Either 'created_at' or 'last_seen'
+        :type column: str
+        :param before: The cutoff datetime
+        :return: The number of sessions deleted
+        """
+        if column not in ('created_at', 'last_seen'):
+            raise ValueError(column)
+        with self._connection() as conn, conn:
+            cursor = conn.execute(
+                "DELETE FROM user_sessions WHERE {} < ?".format(column),
+                (before.strftime(TIMESTAMP_FORMAT),))
+        return cursor.rowcount
+
+    def count(self, max_age: float = 0) -> int:
+        """
+        It returns the number of stored sessions, counting the rows scans
+        the table so the last count is reused while younger than `max_age`
+
+        :param max_age: The number of seconds a count is reused
+        :type max_age: float
+        :return: The number of stored sessions
+        """
+        now = time.monotonic()
+        counted = self._counted
+        if counted is not None and now - counted[0] < max_age:
+            return counted[1]
+        with self._connection() as conn:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM user_sessions").fetchone()[0]
+        self._counted = (now, count)
+        return count
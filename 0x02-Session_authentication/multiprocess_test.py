@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+""" Multi-process test of SessionExpAuth on the shared session server
+
+    $ ./multiprocess_test.py [workers] [sessions]
+
+It starts the session server (api.v1.auth.session_server) on a Unix
+socket in a temporary directory, then `workers` (4 by default) processes
+that each create `sessions` (500) sessions lasting a minute. Every worker
+then looks up the sessions of all the workers and checks that each one
+returns the right user, it prints the time per lookup. Last, one process
+creates sessions lasting 1 second and another one checks, once they
+expired, that it refuses them and that the server dropped their keys.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def open_auth(url: str, duration: int):
+    """ Return a SessionExpAuth using the session server at `url` """
+    os.environ.update(SESSION_STORE_URL=url, SESSION_DURATION=str(duration),
+                      SESSION_REAPER_INTERVAL='0')
+    from api.v1.auth.session_exp_auth import SessionExpAuth
+    return SessionExpAuth()
+
+
+def create_sessions(url: str, duration: int, prefix: str, count: int,
+                    created) -> None:
+    """ Create `count` sessions and send their (session ID, user ID) """
+    auth = open_auth(url, duration)
+    created.put([(auth.create_session("{}-{}".format(prefix, i)),
+                  "{}-{}".format(prefix, i)) for i in range(count)])
+
+
+def look_up(url: str, duration: int, pairs: list, results) -> None:
+    """ Look every session up, send the wrong answers and the time taken """
+    auth = open_auth(url, duration)
+    start = time.perf_counter()
+    wrong = sum(auth.user_id_for_session_id(session_id) != user_id
+                for session_id, user_id in pairs)
+    results.put((os.getpid(), wrong,
+                 (time.perf_counter() - start) / max(len(pairs), 1)))
+
+
+def run(target, *args) -> None:
+    """ Run `target` in a new process and wait for it """
+    process = multiprocessing.Process(target=target, args=args)
+    process.start()
+    process.join()
+    assert process.exitcode == 0, "{} failed".format(target.__name__)
+
+
+def start_server(url: str, directory: str) -> subprocess.Popen:
+    """ Start the session server and wait until it answers """
+    from api.v1.auth.session_server import RemoteSessionStore
+    env = dict(os.environ, PYTHONPATH=ROOT, SESSION_STORE_URL=url)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'api.v1.auth.session_server'], cwd=directory,
+        env=env)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            RemoteSessionStore(url).execute('PING')
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("the session server didn't start")
+
+
+def main() -> None:
+    """ Run the test, exit with an AssertionError if it fails """
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    multiprocessing.set_start_method('spawn')
+    sys.path.insert(0, ROOT)
+    from api.v1.auth.session_server import RemoteSessionStore
+    with tempfile.TemporaryDirectory() as directory:
+        url = 'unix://' + os.path.join(directory, 'sessions.sock')
+        server = start_server(url, directory)
+        try:
+            store = RemoteSessionStore(url)
+            created = multiprocessing.Queue()
+            processes = [multiprocessing.Process(
+                target=create_sessions,
+                args=(url, 60, "w{}".format(i), sessions, created))
+                for i in range(workers)]
+            for process in processes:
+                process.start()
+            pairs = [pair for _ in processes for pair in created.get()]
+            for process in processes:
+                process.join()
+            assert len(store) == workers * sessions, len(store)
+
+            results = multiprocessing.Queue()
+            processes = [multiprocessing.Process(
+                target=look_up, args=(url, 60, pairs, results))
+                for _ in range(workers)]
+            for process in processes:
+                process.start()
+            for _ in processes:
+                pid, wrong, per_lookup = results.get()
+                print("worker {}: {} lookups, {} wrong, {:.0f} us per lookup"
+                      .format(pid, len(pairs), wrong, per_lookup * 1e6))
+                assert wrong == 0, "{} wrong users".format(wrong)
+            for process in processes:
+                process.join()
+
+            run(create_sessions, url, 1, 'short', sessions, created)
+            short = [(session_id, None) for session_id, _ in created.get()]
+            assert len(store) == (workers + 1) * sessions, len(store)
+            time.sleep(2.5)
+            run(look_up, url, 1, short, results)
+            _, wrong, _ = results.get()
+            assert wrong == 0, "{} expired sessions accepted".format(wrong)
+            store.execute('PING')
+            assert len(store) == workers * sessions, \
+                "{} keys left, {} expected".format(len(store),
+                                                   workers * sessions)
+            print("{} expired sessions refused by another process and "
+                  "dropped by the server".format(len(short)))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+""" Soak test of the SessionExpAuth store under create and expire churn
+
+    $ ./soak_test.py [sessions] [duration]
+
+It creates `sessions` (1000000 by default) sessions lasting `duration`
+seconds (1) as fast as it can, with the LRU cap of the store disabled so
+only expiry keeps it bounded. Every 10000 sessions it checks that the
+store and the expiry heap hold no more than the sessions created in the
+last two durations, and it prints their sizes and the peak RSS. At the
+end it waits for every session to expire and checks that one reap
+empties both.
+"""
+import os
+import resource
+import sys
+import time
+
+
+CHECK_EVERY = 10000
+
+
+def main() -> None:
+    """ Run the soak test, exit with an AssertionError if it fails """
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    duration = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    os.environ.update(SESSION_DURATION=str(duration),
+                      SESSION_STORE_MAX_ENTRIES='0',
+                      SESSION_REAPER_INTERVAL='0')
+    os.environ.pop('SESSION_STORE_URL', None)
+    from api.v1.auth.session_exp_auth import SessionExpAuth
+    auth = SessionExpAuth()
+    store = auth.user_id_by_session_id
+    print("{} sessions of {} s".format(sessions, duration))
+    print("{:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        'created', 'store', 'heap', 'bound', 'rss MB'))
+    checkpoints = []
+    peak = 0
+    for created in range(1, sessions + 1):
+        auth.create_session("user-{}".format(created))
+        if created % CHECK_EVERY and created != sessions:
+            continue
+        now = time.monotonic()
+        checkpoints.append((now, created))
+        recent = [count for stamp, count in checkpoints
+                  if stamp < now - 2 * duration]
+        bound = created - (recent[-1] if recent else 0) + \
+            auth.reap_batch_size
+        peak = max(peak, len(store))
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        if created % (CHECK_EVERY * 10) == 0 or created == sessions:
+            print("{:>10} {:>10} {:>10} {:>10} {:>10.1f}".format(
+                created, len(store), len(auth.session_expiry), bound, rss))
+        assert len(store) <= bound, \
+            "store holds {} sessions, more than {}".format(len(store), bound)
+        assert len(auth.session_expiry) <= bound, \
+            "heap holds {} deadlines, more than {}".format(
+                len(auth.session_expiry), bound)
+    time.sleep(duration + 0.1)
+    auth.reap()
+    assert len(store) == 0, "{} sessions left".format(len(store))
+    assert len(auth.session_expiry) == 0, \
+        "{} deadlines left".format(len(auth.session_expiry))
+    print("peak store size {}, store and heap empty after the last reap"
+          .format(peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,68 @@
 
 """ app module """
 
-from flask import Flask, jsonify, request, abort, redirect, url_for
-from auth import Auth
+from flask import Flask, jsonify, request, abort, redirect, url_for, g
+from auth import Auth, PasswordHasherBusy
+from metrics import METRICS
+import os
+import time
 
 
 app = Flask(__name__)
 AUTH = Auth()
+if os.getenv("DB_WARMUP", "0").lower() in ("1", "true", "yes"):
+    AUTH.warm_up()
+
+
+@app.before_request
+def start_timer():
+    """
+    It records the start time of the request
+    """
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    """
+    It records the latency of the request by route, method and status
+    :return: The response object.
+    """
+    start = g.get('request_start')
+    if start is not None:
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        METRICS.observe('http_request_duration_seconds',
+                        (('route', rule), ('method', request.method),
+                         ('status', response.status_code)),
+                        time.perf_counter() - start)
+    return response
+
+
+@app.teardown_request
+def end_request(exception=None):
+    """
+    It releases the database session of the request
+    """
+    AUTH.end_request()
+
+
+@app.errorhandler(PasswordHasherBusy)
+def hasher_busy(error):
+    """
+    It answers at once when the password hasher is saturated
+    :return: A JSON object with a message, and a 503 status
+    """
+    return jsonify({"message": "server busy"}), 503, {'Retry-After': '1'}
+
+
+@app.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics():
+    """
+    It returns the metrics of the service in the Prometheus text format
+    :return: The exposition text
+    """
+    return METRICS.render(), 200, \
+        {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 
 @app.route('/')
@@ -35,10 +91,29 @@ def create_user():
             "message": "user created"
         }
         return jsonify(response)
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
         return jsonify({"message": 'email already registered'}), 400
 
 
+@app.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def create_users():
+    """
+    It registers every {"email", "password"} object of a JSON array
+    :return: A JSON array with an {"email", "message"} object per user
+    """
+    items = request.get_json(silent=True)
+    if type(items) is not list:
+        abort(400)
+    results = AUTH.register_users(
+        (item.get('email'), item.get('password'))
+        if type(item) is dict else (None, None) for item in items)
+    return jsonify([{"email": result["email"],
+                     "message": "user created" if result["user"]
+                     else result["error"]} for result in results])
+
+
 @app.route('/sessions', methods=['POST'], strict_slashes=False)
 def login():
     """
@@ -47,14 +122,15 @@ def login():
     :return: A response object with a cookie.
     """
 
-    is_valid_login = AUTH.valid_login(**request.form)
-    if not request.form['email'] or not\
-            request.form['password'] or not\
-            is_valid_login:
+    email = request.form.get('email')
+    password = request.form.get('password')
+    if not email or not password:
+        abort(401)
+    session_id = AUTH.login(email, password)
+    if session_id is None:
         abort(401)
-    session_id = AUTH.create_session(request.form['email'])
     response = {
-        "email": request.form['email'],
+        "email": email,
         "message": "logged in"
     }
     response = jsonify(response)
@@ -74,7 +150,7 @@ def logout():
     user = AUTH.get_user_from_session_id(session_id)
     if not user:
         abort(403)
-    AUTH.destroy_session(user.id)
+    AUTH.revoke_session(session_id)
     return redirect(url_for('index'))
 
 
@@ -126,6 +202,8 @@ def reset_password():
         AUTH.update_password(reset_token, new_password)
         response = {"email": email, "message": "Password updated"}
         return jsonify(response)
+    except PasswordHasherBusy:
+        raise
     except Exception:
         abort(403)
 
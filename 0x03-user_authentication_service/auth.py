@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
 """ module to hash a password """
 
+import os
+import sys
+import threading
+import time
 import uuid
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List
 import bcrypt
-from db import DB
+from db import DB, env_int
+from metrics import METRICS
 from user import User
+from user_session import UserSession
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+
+BCRYPT_ROUNDS = 12
 
 
 def _hash_password(password: str) -> bytes:
@@ -18,11 +30,301 @@ def _hash_password(password: str) -> bytes:
     :type password: str
     :return: The hashed password.
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed_password
 
 
+class PasswordHasherBusy(Exception):
+    """Raised when every slot of the password hasher is taken"""
+
+
+class PasswordHasher:
+    """Dedicated pool of threads running bcrypt, so a burst of logins
+    can't take every request thread and CPU. At most `workers` hashes run
+    at once and `max_queue` wait, a new one past that is rejected at once.
+    Bulk hashes wait for a free slot instead, and hold at most `max_bulk`
+    slots, so interactive hashes always find one
+    """
+
+    def __init__(self, workers: int, max_queue: int, max_bulk: int = 1):
+        """
+        It creates the pool
+
+        :param workers: The number of hashes running at once
+        :param max_queue: The number of hashes waiting for a thread
+        :param max_bulk: The number of slots bulk hashes can hold, at
+        least 1 and less than the capacity when it is more than 1
+        """
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.max_bulk = max(1, min(max_bulk, self.capacity - 1))
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._bulk_slots = threading.BoundedSemaphore(self.max_bulk)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='bcrypt')
+
+    @classmethod
+    def from_env(cls) -> 'PasswordHasher':
+        """
+        It creates the pool sized by `HASH_WORKERS` (half of the CPUs, at
+        least 1, by default), `HASH_MAX_QUEUE` (4 per worker) and
+        `HASH_MAX_BULK` (1 per worker)
+
+        :return: The pool
+        """
+        workers = env_int("HASH_WORKERS", 0)
+        if workers <= 0:
+            workers = max(1, (os.cpu_count() or 1) // 2)
+        max_queue = env_int("HASH_MAX_QUEUE", workers * 4)
+        return cls(workers, max(0, max_queue),
+                   env_int("HASH_MAX_BULK", workers))
+
+    def submit(self, function, *args, block: bool = False) -> Future:
+        """
+        It queues `function(*args)` on the pool
+
+        :param function: bcrypt.hashpw, bcrypt.checkpw or _hash_password
+        :param block: Wait for a free slot instead of raising
+        :return: The future of the result
+        :raise PasswordHasherBusy: If every slot is taken and not `block`
+        """
+        if not self._slots.acquire(blocking=block):
+            METRICS.inc('password_hash_rejections_total')
+            raise PasswordHasherBusy("password hasher saturated")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(self._timed, function,
+                                           time.perf_counter(), args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def submit_bulk(self, function, *args) -> Future:
+        """
+        It queues `function(*args)` on the pool for a batch job, waiting
+        until one of the `max_bulk` bulk slots and a slot of the pool are
+        free
+
+        :param function: bcrypt.hashpw, bcrypt.checkpw or _hash_password
+        :return: The future of the result
+        """
+        self._bulk_slots.acquire()
+        try:
+            future = self.submit(function, *args, block=True)
+        except BaseException:
+            self._bulk_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._bulk_slots.release())
+        return future
+
+    def run(self, function, *args):
+        """
+        It runs `function(*args)` on the pool and waits for its result
+
+        :raise PasswordHasherBusy: If every slot is taken
+        """
+        return self.submit(function, *args).result()
+
+    def _release(self) -> None:
+        """Free the slot of a finished hash"""
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    @staticmethod
+    def _timed(function, queued: float, args: tuple):
+        """Run a hash, recording its wait in the queue and its duration"""
+        start = time.perf_counter()
+        METRICS.observe('password_hash_queue_wait_seconds', (),
+                        start - queued)
+        try:
+            return function(*args)
+        finally:
+            METRICS.observe('password_hash_seconds',
+                            (('function', function.__name__),),
+                            time.perf_counter() - start)
+
+    def collect(self):
+        """Yield the size and the load of the pool at scrape time"""
+        yield ('password_hash_workers', (), self.workers)
+        yield ('password_hash_pending', (), self._pending)
+
+
+HASHER = PasswordHasher.from_env()
+METRICS.describe('password_hash_queue_wait_seconds', 'histogram',
+                 'Time a password hash waited for a hasher thread')
+METRICS.describe('password_hash_seconds', 'histogram',
+                 'Time spent in bcrypt, by function')
+METRICS.describe('password_hash_rejections_total', 'counter',
+                 'Password hashes rejected because the hasher was full')
+METRICS.describe('password_hash_workers', 'gauge',
+                 'Threads of the password hasher')
+METRICS.describe('password_hash_pending', 'gauge',
+                 'Password hashes running or waiting for a thread')
+METRICS.add_collector(HASHER.collect)
+
+
+UserSnapshot = namedtuple('UserSnapshot', ['id', 'email'])
+
+
+class SessionCache:
+    """Bounded LRU cache of session ID to UserSnapshot, each entry kept
+    for `ttl` seconds. Invalidations are synchronous in this process, the
+    TTL bounds how long another process can serve a destroyed session
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        """
+        It creates an empty cache
+
+        :param max_entries: The number of entries kept, 0 disables it
+        :param ttl: The number of seconds an entry is kept
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'SessionCache':
+        """
+        It creates a cache of `SESSION_CACHE_SIZE` entries (10000) kept
+        `SESSION_CACHE_TTL` seconds (5). Invalidations only reach the cache
+        of this process: with several workers, the others keep accepting
+        a logged out session for up to `SESSION_CACHE_TTL` seconds
+
+        :return: The cache
+        """
+        return cls(env_int("SESSION_CACHE_SIZE", 10000),
+                   env_int("SESSION_CACHE_TTL", 5))
+
+    def get(self, session_id: str) -> UserSnapshot:
+        """
+        It returns the cached user of a session
+
+        :param session_id: The session ID
+        :return: The UserSnapshot, or None if it isn't cached or expired
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[1] < time.monotonic():
+                self._discard(session_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        METRICS.inc('session_cache_lookups_total',
+                    (('result', 'miss' if entry is None else 'hit'),))
+        return None if entry is None else entry[0]
+
+    def put(self, session_id: str, user: UserSnapshot, epoch: int,
+            ttl: float = None) -> None:
+        """
+        It caches the user of a session read from the database, unless an
+        invalidation happened since `epoch` was read, before the read
+
+        :param session_id: The session ID
+        :param user: The UserSnapshot
+        :param epoch: The value of `epoch` before the database read
+        :param ttl: The seconds left to the session, if less than `ttl`
+        """
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            if epoch != self.epoch:
+                return
+            self._discard(session_id)
+            self._entries[session_id] = (user, time.monotonic() + ttl)
+            self._by_user.setdefault(user.id, set()).add(session_id)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_session(self, session_id: str) -> None:
+        """
+        It drops one cached session, call it once the session is deleted
+        from the database
+
+        :param session_id: The session ID
+        """
+        with self._lock:
+            self.epoch += 1
+            self._discard(session_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        It drops every cached session of a user, call it once the change
+        is written to the database
+
+        :param user_id: The ID of the user
+        """
+        with self._lock:
+            self.epoch += 1
+            for session_id in self._by_user.pop(user_id, ()):
+                self._entries.pop(session_id, None)
+
+    def _discard(self, session_id: str) -> None:
+        """Drop one entry, the lock is held"""
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        sessions = self._by_user.get(entry[0].id)
+        if sessions is not None:
+            sessions.discard(session_id)
+            if not sessions:
+                del self._by_user[entry[0].id]
+
+    def collect(self):
+        """Yield the size and the hit ratio of the cache at scrape time"""
+        lookups = self.hits + self.misses
+        yield ('session_cache_entries', (), len(self._entries))
+        yield ('session_cache_hit_ratio', (),
+               self.hits / lookups if lookups else 0.0)
+
+
+METRICS.describe('session_cache_lookups_total', 'counter',
+                 'Session cache lookups, by result (hit or miss)')
+METRICS.describe('session_cache_entries', 'gauge',
+                 'Sessions in the session cache')
+METRICS.describe('session_cache_hit_ratio', 'gauge',
+                 'Session cache hits over lookups since the start')
+
+
+def run_every(interval: float, task, name: str) -> threading.Thread:
+    """
+    It starts a daemon thread calling `task` every `interval` seconds, an
+    exception of one call doesn't stop the next ones
+
+    :param interval: The number of seconds between two calls
+    :param task: The callable to run
+    :param name: The name of the thread
+    :return: The started thread
+    """
+    def run_forever():
+        """Run the task until the process exits"""
+        while True:
+            time.sleep(interval)
+            try:
+                task()
+            except Exception as err:
+                print("{}: {!r}".format(name, err), file=sys.stderr)
+
+    thread = threading.Thread(target=run_forever, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
 def _generate_uuid() -> str:
     """
     "Generate a new UUID."
@@ -37,7 +339,34 @@ class Auth:
     """
 
     def __init__(self):
+        """ Open the database, sessions last `SESSION_DURATION` seconds (0,
+        forever, by default) and the expired ones are purged every
+        `SESSION_PURGE_INTERVAL` seconds (60) by `SESSION_PURGE_BATCH` rows
+        (500). Reset tokens last `RESET_TOKEN_TTL` seconds (3600) and are
+        cleared every `RESET_TOKEN_PURGE_INTERVAL` seconds (60) by
+        `RESET_TOKEN_PURGE_BATCH` rows (500)."""
         self._db = DB()
+        self._sessions = SessionCache.from_env()
+        METRICS.add_collector(self._sessions.collect)
+        self.session_duration = env_int("SESSION_DURATION", 0)
+        self.purge_batch = env_int("SESSION_PURGE_BATCH", 500)
+        interval = env_int("SESSION_PURGE_INTERVAL", 60)
+        if self.session_duration > 0 and interval > 0:
+            run_every(interval, self.purge_expired_sessions, 'session-purge')
+        self.reset_token_ttl = env_int("RESET_TOKEN_TTL", 3600)
+        self.reset_purge_batch = env_int("RESET_TOKEN_PURGE_BATCH", 500)
+        interval = env_int("RESET_TOKEN_PURGE_INTERVAL", 60)
+        if self.reset_token_ttl > 0 and interval > 0:
+            run_every(interval, self.purge_expired_reset_tokens,
+                      'reset-token-purge')
+
+    def warm_up(self) -> None:
+        """ Prime the database caches before the first request."""
+        self._db.warm_up()
+
+    def end_request(self) -> None:
+        """ Release the database session of the current request."""
+        self._db.remove_session()
 
     def register_user(self, email: str, password: str) -> User:
         """
@@ -56,10 +385,63 @@ class Auth:
             self._db.find_user_by(email=email)
             raise(ValueError)
         except NoResultFound:
-            hashed_password = _hash_password(password)
+            hashed_password = HASHER.run(_hash_password, password)
             created_user = self._db.add_user(email, hashed_password)
             return created_user
 
+    def register_users(self, users: Iterable[tuple]) -> List[dict]:
+        """
+        Register many users at once. The existing emails are found with IN
+        queries, the passwords hashed concurrently on the bulk slots of the
+        password hasher, so logins keep the other slots, and the new users
+        inserted in one transaction
+
+        :param users: (email, password) pairs
+        :type users: Iterable[tuple]
+        :return: One {"email", "user", "error"} dictionary per pair, in
+        order, `user` is the created User or None and `error` why not
+        """
+        users = list(users)
+        results = [{"email": email, "user": None, "error": None}
+                   for email, _ in users]
+        pending = {}
+        for index, (email, password) in enumerate(users):
+            if not email or not password or type(email) is not str \
+                    or type(password) is not str:
+                results[index]["error"] = "email or password missing"
+            elif email in pending:
+                results[index]["error"] = "email duplicated in the request"
+            else:
+                pending[email] = index
+        self._drop_registered(pending, results)
+        if not pending:
+            return results
+        futures = [HASHER.submit_bulk(_hash_password, users[index][1])
+                   for index in pending.values()]
+        hashed = dict(zip(pending,
+                          (future.result() for future in futures)))
+        try:
+            self._db.add_users((email, hashed[email]) for email in pending)
+        except IntegrityError:
+            self._db.rollback()
+            self._drop_registered(pending, results)
+            self._db.add_users((email, hashed[email]) for email in pending)
+        for user in self._db.find_users_by_emails(pending):
+            results[pending[user.email]]["user"] = user
+        return results
+
+    def _drop_registered(self, pending: dict, results: List[dict]) -> None:
+        """
+        Remove the emails already registered from `pending` and record the
+        error in their result
+
+        :param pending: The emails to register, with their index
+        :param results: The results of register_users
+        """
+        for user in self._db.find_users_by_emails(list(pending)):
+            results[pending.pop(user.email)]["error"] = \
+                "email already registered"
+
     def valid_login(self, email: str, password: str) -> bool:
         """
         "Check if the given email and password are valid."
@@ -72,42 +454,103 @@ class Auth:
         """
         try:
             user = self._db.find_user_by(email=email)
-            if bcrypt.checkpw(password.encode('utf-8'), user.hashed_password):
+            if HASHER.run(bcrypt.checkpw, password.encode('utf-8'),
+                          user.hashed_password):
                 return True
             else:
                 return False
         except NoResultFound:
             return False
 
+    def login(self, email: str, password: str) -> str:
+        """
+        Log a user in with one lookup by email, the password check, and the
+        new session inserted in the sessions table, the other sessions of
+        the user stay valid
+
+        :param email: str
+        :type email: str
+        :param password: str
+        :type password: str
+        :return: The new session ID, or None if the email or the password
+        is wrong
+        """
+        try:
+            user = self._db.find_user_by(email=email)
+        except NoResultFound:
+            return None
+        if not HASHER.run(bcrypt.checkpw, password.encode('utf-8'),
+                          user.hashed_password):
+            return None
+        return self._add_session(user.id)
+
     def create_session(self, email: str) -> str:
         """ Create a new session for the user with the given email."""
 
         try:
             user = self._db.find_user_by(email=email)
-            session_id = _generate_uuid()
-            self._db.update_user(user.id, session_id=session_id)
-            return session_id
+            return self._add_session(user.id)
         except NoResultFound:
             return None
 
-    def get_user_from_session_id(self, session_id: str):
-        """ Get the user from the session id."""
+    def _add_session(self, user_id: int) -> str:
+        """ Store a new session of a user and return its ID."""
+        session_id = _generate_uuid()
+        expires_at = None
+        if self.session_duration > 0:
+            expires_at = datetime.utcnow() + \
+                timedelta(seconds=self.session_duration)
+        self._db.add_session(user_id, session_id, expires_at)
+        return session_id
+
+    def get_user_from_session_id(self, session_id: str) -> UserSnapshot:
+        """ Get the (id, email) of the user from the session id, from the
+        session cache or else from the database."""
         try:
             if session_id is None:
                 return None
-            user = self._db.find_user_by(session_id=session_id)
+            user = self._sessions.get(session_id)
+            if user is not None:
+                return user
+            epoch = self._sessions.epoch
+            now = datetime.utcnow()
+            user_id, email, expires_at = \
+                self._db.find_session_user(session_id, now)
+            user = UserSnapshot(user_id, email)
+            ttl = None
+            if expires_at is not None:
+                ttl = (expires_at - now).total_seconds()
+            self._sessions.put(session_id, user, epoch, ttl)
             return user
         except Exception as e:
             return None
 
+    def list_sessions(self, user_id: int) -> List[UserSession]:
+        """ List the sessions of a user, oldest first."""
+        return self._db.find_sessions_by_user(user_id)
+
+    def revoke_session(self, session_id: str) -> bool:
+        """ Revoke one session, return False if it didn't exist."""
+        if session_id is None:
+            return False
+        revoked = self._db.delete_session(session_id)
+        self._sessions.invalidate_session(session_id)
+        return revoked
+
     def destroy_session(self, user_id: str):
-        """ Destroy the session for the user with the given id."""
-        try:
-            self._db.update_user(user_id, session_id=None)
-        except NoResultFound:
-            pass
+        """ Destroy every session of the user with the given id."""
+        self._db.delete_user_sessions(user_id)
+        self._sessions.invalidate_user(user_id)
         return None
 
+    def purge_expired_sessions(self) -> int:
+        """ Delete the expired sessions in batches, return how many."""
+        try:
+            return self._db.purge_expired_sessions(datetime.utcnow(),
+                                                   self.purge_batch)
+        finally:
+            self._db.remove_session()
+
     def get_reset_password_token(self, email: str) -> str:
         """
         > It takes an email address, finds the user with that email address,
@@ -119,9 +562,10 @@ class Auth:
         :return: A reset token
         """
         try:
-            user = self._db.find_user_by(email=email)
             reset_token = _generate_uuid()
-            self._db.update_user(user.id, reset_token=reset_token)
+            self._db.find_and_update_user(
+                {'reset_token': reset_token,
+                 'reset_token_issued_at': datetime.utcnow()}, email=email)
             return reset_token
         except Exception as err:
             raise(ValueError)
@@ -130,7 +574,7 @@ class Auth:
         """
         > It takes a reset token and a new password, finds the user with that
         reset token, hashes the password, and updates the user with the new
-        password
+        password. A token older than `RESET_TOKEN_TTL` seconds is refused
 
         :param reset_token: The reset token
         :type reset_token: str
@@ -140,8 +584,31 @@ class Auth:
         """
         try:
             user = self._db.find_user_by(reset_token=reset_token)
-            hashed_password = _hash_password(password)
+            if self._reset_token_expired(user.reset_token_issued_at):
+                raise(ValueError)
+            hashed_password = HASHER.run(_hash_password, password)
             self._db.update_user(user.id, hashed_password=hashed_password,
-                                 reset_token=None)
+                                 reset_token=None, reset_token_issued_at=None)
+            self._sessions.invalidate_user(user.id)
+        except PasswordHasherBusy:
+            raise
         except Exception as err:
             raise(ValueError)
+
+    def _reset_token_expired(self, issued_at: datetime) -> bool:
+        """ Tell if a reset token issued at `issued_at` is too old."""
+        if self.reset_token_ttl <= 0:
+            return False
+        return issued_at is None or issued_at < datetime.utcnow() - \
+            timedelta(seconds=self.reset_token_ttl)
+
+    def purge_expired_reset_tokens(self) -> int:
+        """ Clear the expired reset tokens in batches, return how many."""
+        if self.reset_token_ttl <= 0:
+            return 0
+        try:
+            return self._db.purge_expired_reset_tokens(
+                datetime.utcnow() - timedelta(seconds=self.reset_token_ttl),
+                self.reset_purge_batch)
+        finally:
+            self._db.remove_session()
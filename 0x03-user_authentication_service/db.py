@@ -2,14 +2,20 @@
 
 """DB module
 """
-from sqlalchemy import create_engine
+import os
+from datetime import datetime
+from sqlalchemy import create_engine, event, inspect, or_, text, update
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlalchemy.orm.session import Session
+from typing import Iterable, List
 from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.orm.exc import NoResultFound
 
 from user import Base, User
+from user_session import UserSession
 
 
 def has_keys(**kwargs):
@@ -22,32 +28,180 @@ def has_keys(**kwargs):
         'email',
         'session_id',
         'reset_token',
+        'reset_token_issued_at',
         'hashed_password'
     ]
     return all(
         [True if key in properties else False for key in kwargs.keys()])
 
 
+def env_int(name: str, default: int) -> int:
+    """
+    It reads an integer from the environment
+
+    :param name: The name of the variable
+    :param default: The value if it isn't set or isn't an integer
+    :return: The integer
+    """
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def create_db_engine(url: str):
+    """
+    It creates the engine of the database at `url`. The request threads
+    share a pool of `DB_POOL_SIZE` connections (8), plus `DB_MAX_OVERFLOW`
+    (8) under load. Every new SQLite connection is set to WAL journaling,
+    so readers don't wait for the writer, synchronous=NORMAL and a busy
+    timeout of `DB_BUSY_TIMEOUT` milliseconds (5000)
+
+    :param url: The URL of the database
+    :return: The engine
+    """
+    pool_size = env_int("DB_POOL_SIZE", 8)
+    max_overflow = env_int("DB_MAX_OVERFLOW", 8)
+    busy_timeout = env_int("DB_BUSY_TIMEOUT", 5000)
+    database = make_url(url)
+    if database.get_backend_name() != 'sqlite':
+        return create_engine(url, echo=False, pool_size=pool_size,
+                             max_overflow=max_overflow)
+    if database.database in (None, '', ':memory:'):
+        return create_engine(url, echo=False, poolclass=StaticPool,
+                             connect_args={'check_same_thread': False})
+    engine = create_engine(url, echo=False, poolclass=QueuePool,
+                           pool_size=pool_size, max_overflow=max_overflow,
+                           connect_args={'check_same_thread': False,
+                                         'timeout': busy_timeout / 1000})
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        """Tune each new SQLite connection"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout={:d}".format(busy_timeout))
+        cursor.close()
+
+    return engine
+
+
+def migrate(engine) -> None:
+    """
+    It creates the missing tables, then adds the missing nullable columns
+    and the missing indexes of the tables that already exist, so a database
+    created before a column or an index was declared keeps its rows.
+    Creating the unique index on `email` raises an IntegrityError if the
+    table holds duplicate emails. When the sessions table is created, the
+    sessions stored in `users.session_id` are copied into it, then that
+    column is cleared and its index dropped. Reset tokens issued before
+    `reset_token_issued_at` existed count as issued now.
+
+    :param engine: The engine of the database
+    """
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    Base.metadata.create_all(engine)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column['name']
+                    for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            with engine.begin() as connection:
+                connection.execute(text(
+                    "ALTER TABLE {} ADD COLUMN {} {}".format(
+                        table.name, column.name,
+                        column.type.compile(engine.dialect))))
+            added.add((table.name, column.name))
+    if ('users', 'reset_token_issued_at') in added:
+        with engine.begin() as connection:
+            connection.execute(text(
+                "UPDATE users SET reset_token_issued_at = :now "
+                "WHERE reset_token IS NOT NULL"), {'now': datetime.utcnow()})
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    copy = 'users' in tables and UserSession.__tablename__ not in tables
+    indexed = 'users' in tables and 'ix_users_session_id' in {
+        index['name'] for index in inspector.get_indexes('users')}
+    if copy or indexed:
+        with engine.begin() as connection:
+            if copy:
+                connection.execute(text(
+                    "INSERT INTO sessions (session_id, user_id, created_at) "
+                    "SELECT session_id, id, :now FROM users "
+                    "WHERE session_id IS NOT NULL"),
+                    {'now': datetime.utcnow()})
+            if indexed:
+                connection.execute(text("DROP INDEX ix_users_session_id"))
+            connection.execute(text(
+                "UPDATE users SET session_id = NULL "
+                "WHERE session_id IS NOT NULL"))
+
+
 class DB:
     """DB class
     """
 
-    def __init__(self) -> None:
-        """Initialize a new DB instance
+    def __init__(self, url: str = None, persistent: bool = None) -> None:
+        """Initialize a new DB instance on `url`, `DB_URL` or sqlite:///a.db
+        by default. Every table is dropped first unless the DB is
+        persistent (`DB_PERSISTENT=1`), then only missing tables and indexes
+        are created
         """
-        self._engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self._engine)
-        Base.metadata.create_all(self._engine)
-        self.__session = None
+        if url is None:
+            url = os.getenv("DB_URL", "sqlite:///a.db")
+        if persistent is None:
+            persistent = os.getenv("DB_PERSISTENT", "0").lower() \
+                in ("1", "true", "yes")
+        self._engine = create_db_engine(url)
+        self.persistent = persistent
+        if not persistent:
+            Base.metadata.drop_all(self._engine)
+        migrate(self._engine)
+        self._sessions = scoped_session(
+            sessionmaker(bind=self._engine, expire_on_commit=False))
 
     @property
     def _session(self) -> Session:
-        """Memoized session object
+        """Session object of the calling thread, kept until remove_session
+        """
+        return self._sessions()
+
+    def remove_session(self) -> None:
+        """Close the session of the calling thread, its connection goes back
+        to the pool
+        """
+        self._sessions.remove()
+
+    def warm_up(self) -> None:
+        """Read the indexes of the lookup columns once, so their pages are
+        cached, and run each hot lookup once, so its statement is compiled
+        before the first request. The warmed connection goes back to the
+        pool for the requests
         """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        if self._engine.dialect.name == 'sqlite':
+            for column in ('email', 'reset_token'):
+                self._session.execute(text(
+                    "SELECT count(*) FROM users WHERE {} >= ''".format(
+                        column)))
+            self._session.execute(text(
+                "SELECT count(*) FROM sessions WHERE session_id >= ''"))
+        for key in ('id', 'email', 'reset_token'):
+            try:
+                self.find_user_by(**{key: 0 if key == 'id' else ''})
+            except NoResultFound:
+                pass
+        try:
+            self.find_session_user('', datetime.utcnow())
+        except NoResultFound:
+            pass
+        self.remove_session()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """Add a new user to the DB
@@ -57,6 +211,114 @@ class DB:
         self._session.commit()
         return user
 
+    def add_users(self, rows: Iterable[tuple]) -> None:
+        """Insert (email, hashed_password) rows with one executemany in a
+        single transaction
+        """
+        self._session.bulk_insert_mappings(
+            User, [{'email': email, 'hashed_password': hashed_password}
+                   for email, hashed_password in rows])
+        self._session.commit()
+
+    def rollback(self) -> None:
+        """Roll back the transaction of the calling thread
+        """
+        self._session.rollback()
+
+    def find_users_by_emails(self, emails: Iterable[str],
+                             chunk_size: int = 500) -> List[User]:
+        """Find the users having one of `emails`, with one IN query per
+        `chunk_size` emails
+        """
+        emails = list(emails)
+        users = []
+        for start in range(0, len(emails), chunk_size):
+            users.extend(self._session.query(User).filter(
+                User.email.in_(emails[start:start + chunk_size])).all())
+        return users
+
+    def add_session(self, user_id: int, session_id: str,
+                    expires_at: datetime = None) -> None:
+        """Insert a session row, the users table isn't written
+        """
+        self._session.add(UserSession(session_id=session_id, user_id=user_id,
+                                      expires_at=expires_at))
+        self._session.commit()
+
+    def find_session_user(self, session_id: str, now: datetime) -> tuple:
+        """Find the (user_id, email, expires_at) of a live session with a
+        lookup on the primary key of sessions, then of users
+        """
+        row = self._session.query(
+            User.id, User.email, UserSession.expires_at).join(
+            UserSession, UserSession.user_id == User.id).filter(
+            UserSession.session_id == session_id,
+            or_(UserSession.expires_at.is_(None),
+                UserSession.expires_at > now)).first()
+        if row is None:
+            raise(NoResultFound)
+        return row
+
+    def find_sessions_by_user(self, user_id: int) -> List[UserSession]:
+        """Find the sessions of a user, oldest first, on the user_id index
+        """
+        return self._session.query(UserSession).filter_by(
+            user_id=user_id).order_by(UserSession.created_at).all()
+
+    def delete_session(self, session_id: str) -> bool:
+        """Delete one session, return False if it didn't exist
+        """
+        deleted = self._session.query(UserSession).filter_by(
+            session_id=session_id).delete(synchronize_session=False)
+        self._session.commit()
+        return deleted > 0
+
+    def delete_user_sessions(self, user_id: int) -> int:
+        """Delete every session of a user, return how many were deleted
+        """
+        deleted = self._session.query(UserSession).filter_by(
+            user_id=user_id).delete(synchronize_session=False)
+        self._session.commit()
+        return deleted
+
+    def purge_expired_sessions(self, now: datetime,
+                               batch_size: int = 500) -> int:
+        """Delete the sessions expired at `now`, `batch_size` rows per
+        transaction on the expires_at index so the write lock is held
+        briefly, return how many were deleted
+        """
+        purged = 0
+        while True:
+            expired = self._session.query(UserSession.session_id).filter(
+                UserSession.expires_at <= now).limit(batch_size)
+            deleted = self._session.query(UserSession).filter(
+                UserSession.session_id.in_(expired.scalar_subquery())).delete(
+                synchronize_session=False)
+            self._session.commit()
+            purged += deleted
+            if deleted < batch_size:
+                return purged
+
+    def purge_expired_reset_tokens(self, issued_before: datetime,
+                                   batch_size: int = 500) -> int:
+        """Clear the reset tokens issued before `issued_before`, one UPDATE
+        of at most `batch_size` rows per transaction on the
+        reset_token_issued_at index so the write lock is held briefly,
+        return how many were cleared
+        """
+        purged = 0
+        while True:
+            expired = self._session.query(User.id).filter(
+                User.reset_token_issued_at < issued_before).limit(batch_size)
+            cleared = self._session.execute(
+                update(User).where(User.id.in_(expired.scalar_subquery()))
+                .values(reset_token=None, reset_token_issued_at=None)
+                .execution_options(synchronize_session=False)).rowcount
+            self._session.commit()
+            purged += cleared
+            if cleared < batch_size:
+                return purged
+
     def find_user_by(self, **kwargs) -> User:
         """Find a user by parameters
         """
@@ -68,9 +330,27 @@ class DB:
         return user
 
     def update_user(self, user_id: int, **kwargs) -> None:
-        """Update a user by parameters """
+        """Update a user by parameters with one UPDATE statement, committed
+        at once, raise NoResultFound if there's no user with that ID
+        """
         if not has_keys(**kwargs):
             raise(ValueError)
-        user_found = self.find_user_by(id=user_id)
-        [setattr(user_found, key, value) for key, value in kwargs.items()]
+        result = self._session.execute(
+            update(User).where(User.id == user_id).values(**kwargs)
+            .execution_options(synchronize_session='evaluate'))
+        self._session.commit()
+        if result.rowcount == 0:
+            raise(NoResultFound)
         return None
+
+    def find_and_update_user(self, values: dict, **kwargs) -> User:
+        """Find a user by parameters and update it with `values` in one
+        transaction, the SELECT is followed by an UPDATE on the primary key
+        Return the updated user
+        """
+        if not has_keys(**values):
+            raise(ValueError)
+        user = self.find_user_by(**kwargs)
+        [setattr(user, key, value) for key, value in values.items()]
+        self._session.commit()
+        return user
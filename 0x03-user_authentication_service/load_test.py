@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+""" Concurrent load test of GET /profile and POST /sessions
+
+    $ ./load_test.py [seconds] [threads...]
+
+It starts app.py on a fresh persistent SQLite database in a temporary
+directory, registers one user per thread and logs each in, then for each
+number of `threads` (1 2 4 8 16 by default) sends requests to each
+endpoint from that many keep-alive connections for `seconds` seconds (5).
+A last, mixed, run sends logins from the largest number of threads while
+two more threads poll /profile. It prints the throughput, the p50 and p99
+latencies, the 503 answers and the other errors of each endpoint.
+"""
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PORT = 5000
+PASSWORD = "load pwd"
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def start_server(directory: str) -> subprocess.Popen:
+    """ Start app.py on a database in `directory` """
+    env = dict(os.environ, PYTHONPATH=ROOT, DB_PERSISTENT='1',
+               DB_URL='sqlite:///' + os.path.join(directory, 'load.db'))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'app.py')], cwd=directory,
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', PORT)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("the server didn't start")
+
+
+def post(connection, path: str, fields: dict):
+    """ Send a form and return the response, read """
+    connection.request('POST', path, urllib.parse.urlencode(fields), FORM)
+    response = connection.getresponse()
+    response.read()
+    return response
+
+
+def log_in(connection, email: str) -> str:
+    """ Log a user in and return the session cookie header """
+    response = post(connection, '/sessions',
+                    {'email': email, 'password': PASSWORD})
+    if response.status != 200:
+        return None
+    for name, value in response.getheaders():
+        if name.lower() == 'set-cookie':
+            return value.split(';', 1)[0]
+    return None
+
+
+def run(plan: list, seconds: float) -> dict:
+    """ Send requests from one connection per (endpoint, email, cookie) of
+    `plan` for `seconds` seconds, return the sorted latencies, the number
+    of 503 and the number of other errors of each endpoint """
+    results = {endpoint: ([], [0], [0]) for endpoint, _, _ in plan}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(endpoint: str, email: str, cookie: str):
+        """ Send requests on one keep-alive connection """
+        connection = http.client.HTTPConnection('127.0.0.1', PORT)
+        mine, busy, failed = [], 0, 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                if endpoint == 'profile':
+                    connection.request('GET', '/profile',
+                                       headers={'Cookie': cookie or ''})
+                    response = connection.getresponse()
+                    response.read()
+                else:
+                    response = post(connection, '/sessions',
+                                    {'email': email, 'password': PASSWORD})
+                status = response.status
+            except OSError:
+                connection.close()
+                status = None
+            if status == 200:
+                mine.append(time.perf_counter() - start)
+            elif status == 503:
+                busy += 1
+            else:
+                failed += 1
+        with lock:
+            latencies, busy_count, errors = results[endpoint]
+            latencies.extend(mine)
+            busy_count[0] += busy
+            errors[0] += failed
+
+    workers = [threading.Thread(target=client, args=step) for step in plan]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return {endpoint: (sorted(latencies), busy[0], errors[0])
+            for endpoint, (latencies, busy, errors) in results.items()}
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    """ Return the latency below which `fraction` of the requests ran """
+    if not latencies:
+        return float('nan')
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def report(label: str, threads: int, results: dict,
+           seconds: float) -> None:
+    """ Print one line per endpoint of a run """
+    for endpoint, (latencies, busy, errors) in results.items():
+        print("{:<8} {:<8} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>5} {:>7}"
+              .format(label, endpoint, threads, len(latencies) / seconds,
+                      percentile(latencies, 0.5) * 1000,
+                      percentile(latencies, 0.99) * 1000, busy, errors))
+
+
+def main() -> None:
+    """ Run the load test and print the results """
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4, 8, 16]
+    print("{} s per run, {} CPUs".format(seconds, os.cpu_count()))
+    print("{:<8} {:<8} {:>7} {:>9} {:>9} {:>9} {:>5} {:>7}".format(
+        'run', 'endpoint', 'threads', 'req/s', 'p50 ms', 'p99 ms', '503',
+        'errors'))
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(directory)
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', PORT)
+            emails = ["load{}@hbtn.io".format(i)
+                      for i in range(max(counts) + 2)]
+            for email in emails:
+                post(connection, '/users',
+                     {'email': email, 'password': PASSWORD})
+            cookies = [log_in(connection, email) for email in emails]
+            for endpoint in ('profile', 'sessions'):
+                for threads in counts:
+                    plan = [(endpoint, emails[i], cookies[i])
+                            for i in range(threads)]
+                    report('single', threads, run(plan, seconds), seconds)
+            plan = [('sessions', emails[i], cookies[i])
+                    for i in range(max(counts))] + \
+                [('profile', emails[i], cookies[i])
+                 for i in range(max(counts), max(counts) + 2)]
+            report('mixed', len(plan), run(plan, seconds), seconds)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
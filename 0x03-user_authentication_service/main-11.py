@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Main file, a logout takes effect at once even when /profile was served
+from the session cache
+"""
+from app import app
+
+email = 'bob@bob.com'
+password = 'MyPwdOfBob'
+client = app.test_client(use_cookies=False)
+
+
+def log_in() -> str:
+    """ Log bob in and return his session cookie """
+    response = client.post('/sessions',
+                           data={'email': email, 'password': password})
+    assert response.status_code == 200
+    return response.headers['Set-Cookie'].split(';', 1)[0]
+
+
+def profile(cookie: str) -> int:
+    """ Return the status of GET /profile with `cookie` """
+    return client.get('/profile', headers={'Cookie': cookie}).status_code
+
+
+client.post('/users', data={'email': email, 'password': password})
+laptop = log_in()
+phone = log_in()
+assert profile(laptop) == 200
+assert profile(laptop) == 200
+response = client.delete('/sessions', headers={'Cookie': laptop})
+assert response.status_code == 302
+assert profile(laptop) == 403
+assert profile(phone) == 200
+print("logout effective at once, other sessions kept")
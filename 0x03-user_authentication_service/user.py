@@ -3,17 +3,19 @@
 """User Schema Module"""
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DateTime, Integer, String
 
 Base = declarative_base()
 
 
 class User(Base):
-    """User Schema"""
+    """User Schema, sessions live in the sessions table, `session_id` is
+    only kept so older databases keep their schema"""
     __tablename__ = 'users'
 
     id = Column(Integer, primary_key=True)
-    email = Column(String(250), nullable=False)
+    email = Column(String(250), nullable=False, unique=True, index=True)
     hashed_password = Column(String(250), nullable=False)
     session_id = Column(String(250), nullable=True)
-    reset_token = Column(String(250), nullable=True)
+    reset_token = Column(String(250), nullable=True, index=True)
+    reset_token_issued_at = Column(DateTime, nullable=True, index=True)
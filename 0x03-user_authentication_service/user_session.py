@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+"""User Session Schema Module"""
+
+from datetime import datetime
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from user import Base
+
+
+class UserSession(Base):
+    """User Session Schema, one row per logged in device, so session
+    writes don't touch the users table"""
+    __tablename__ = 'sessions'
+
+    session_id = Column(String(250), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False,
+                     index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=True, index=True)